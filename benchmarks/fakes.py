@@ -0,0 +1,354 @@
+"""
+Local stand-ins for the Reddit and Gemini clients used by RedditBot.
+
+The fake Reddit objects subclass the PRAW models so the bot's isinstance checks
+behave as in production, but they never touch the network: attributes are set
+directly and replies, reads and lookups are served from in-memory comment trees.
+The fake Gemini client returns schema-valid JSON after a configurable latency and
+fails with 429/503 errors at a configurable rate.
+"""
+import copy
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import praw
+from google.genai import errors
+
+_ids = itertools.count(1)
+
+
+def new_id():
+    return f"f{next(_ids):07x}"
+
+
+class FakeRedditor:
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class FakeSubreddit:
+    def __init__(self, display_name):
+        self.display_name = display_name
+
+    def __str__(self):
+        return self.display_name
+
+
+class FakeModelMixin:
+    """Sets attributes directly so PRAW's lazy loading and attribute conversion never run."""
+
+    def _init_fake(self, reddit, **attributes):
+        self.__dict__.update(_reddit=reddit, _fetched=True, **attributes)
+
+    def __setattr__(self, attribute, value):
+        self.__dict__[attribute] = value
+
+
+class FakeComment(FakeModelMixin, praw.models.Comment):
+    def __init__(self, reddit, submission, parent_id, author, body):
+        self._init_fake(
+            reddit,
+            id=new_id(),
+            _submission=submission,
+            parent_id=parent_id,
+            link_id=f"t3_{submission.id}",
+            subreddit=submission.subreddit,
+            author=FakeRedditor(author),
+            body=body,
+            was_comment=True,
+            received_at=None,
+            replied_at=None,
+        )
+
+    @property
+    def replies(self):
+        return self.__dict__.get("_replies", [])
+
+    def reply(self, body):
+        return self._reddit.post_reply(self, body)
+
+    def mark_read(self):
+        self._reddit.latency("mark_read")
+
+
+class FakeSubmission(FakeModelMixin, praw.models.Submission):
+    def __init__(self, reddit, title, selftext, author, subreddit):
+        self._init_fake(
+            reddit,
+            id=new_id(),
+            title=title,
+            selftext=selftext,
+            author=FakeRedditor(author),
+            subreddit=FakeSubreddit(subreddit),
+            comment_list=[],
+        )
+
+    @property
+    def comments(self):
+        # PRAW defines comments as a property, so it cannot be set as an instance attribute
+        return SimpleNamespace(list=lambda: list(self.comment_list))
+
+
+class FakeInbox:
+    def __init__(self, reddit):
+        self.reddit = reddit
+
+    def stream(self):
+        """Replays the recorded mentions once, honouring their recorded inter-arrival delays."""
+        for delay, mention in self.reddit.mentions:
+            if delay:
+                time.sleep(delay)
+            mention.received_at = time.perf_counter()
+            yield mention
+
+
+class FakeReddit:
+    """
+    In-memory Reddit with configurable per-call latency (seconds) for the
+    operations the bot performs: loading a comment forest, info lookups,
+    replies and marking items read.
+    """
+
+    def __init__(self, username="ArgumentAnalyzerBot", latencies=None, seed=0):
+        self.username = username
+        self.latencies = latencies or {}
+        self.random = random.Random(seed)
+        self.submissions = {}
+        self.comments = {}
+        self.mentions = []  # (delay before the mention, FakeComment)
+        self.replies = []
+        self._lock = threading.Lock()
+        self.inbox = FakeInbox(self)
+        self.user = SimpleNamespace(me=lambda: FakeRedditor(self.username))
+        self.calls = {}
+
+    def latency(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        delay = self.latencies.get(operation, 0)
+        if delay:
+            time.sleep(delay)
+
+    # --- Building comment trees ---
+    def add_thread(self, depth, extra_comments=0, subreddit="benchmark", body_words=60, selftext_words=120):
+        """
+        Creates a submission with a reply chain of the given depth plus extra_comments
+        attached at random points. Returns the submission and the deepest comment.
+        """
+        submission = FakeSubmission(self, f"Benchmark thread {len(self.submissions) + 1}", lorem(self.random, selftext_words),
+                                    f"op_{len(self.submissions)}", subreddit)
+        self.submissions[submission.id] = submission
+
+        parent_id = f"t3_{submission.id}"
+        chain = []
+        for level in range(depth):
+            comment = self.add_comment(submission, parent_id, f"user_{level % 7}", lorem(self.random, body_words))
+            chain.append(comment)
+            parent_id = f"t1_{comment.id}"
+        for _ in range(extra_comments):
+            parent = self.random.choice(chain) if chain else None
+            self.add_comment(submission, f"t1_{parent.id}" if parent else f"t3_{submission.id}",
+                             f"user_{self.random.randrange(50)}", lorem(self.random, body_words))
+        return submission, chain[-1] if chain else None
+
+    def add_comment(self, submission, parent_id, author, body):
+        comment = FakeComment(self, submission, parent_id, author, body)
+        self.comments[comment.id] = comment
+        submission.comment_list.append(comment)
+        return comment
+
+    def add_mention(self, submission, parent, command, delay=0.0, author="requester"):
+        """Queues an inbox mention replying to parent (a comment, or None for a top-level comment)."""
+        parent_id = f"t1_{parent.id}" if parent else f"t3_{submission.id}"
+        mention = FakeComment(self, submission, parent_id, author, f"u/{self.username} {command}")
+        self.comments[mention.id] = mention
+        self.mentions.append((delay, mention))
+        return mention
+
+    # --- Endpoints used by the bot ---
+    def submission(self, id):
+        self.latency("submission")
+        return self.submissions[id]
+
+    def info(self, fullnames):
+        self.latency("info")
+        return [self.comments[fullname[3:]] for fullname in fullnames if fullname[3:] in self.comments]
+
+    def get(self, path, params=None):
+        """Serves a comment permalink: the comment nested under up to params['context'] of its ancestors."""
+        self.latency("context")
+        comment = copy.copy(self.comments[path.rstrip("/").rsplit("/", 1)[-1]])
+        for _ in range((params or {}).get("context", 0)):
+            if not comment.parent_id.startswith("t1_"):
+                break
+            parent = copy.copy(self.comments[comment.parent_id[3:]])
+            parent._replies = [comment]
+            comment = parent
+        return [SimpleNamespace(children=[comment.submission]), SimpleNamespace(children=[comment])]
+
+    def comment(self, id):
+        return self.comments[id]
+
+    def post_reply(self, parent, body):
+        self.latency("reply")
+        reply = FakeComment(self, parent.submission, f"t1_{parent.id}", self.username, body)
+        with self._lock:
+            self.comments[reply.id] = reply
+            self.replies.append(reply)
+        if parent.replied_at is None:
+            parent.replied_at = time.perf_counter()
+        return reply
+
+
+def lorem(rng, words):
+    vocabulary = ("because", "evidence", "therefore", "claim", "study", "policy", "always", "never", "people",
+                  "data", "shows", "clearly", "wrong", "right", "economy", "tax", "growth", "percent", "since",
+                  "nobody", "everyone", "argument", "source", "however", "moreover", "city", "rent", "prices")
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+class FakeCaches:
+    """Stand-in for client.caches: keeps cached prompt contents in memory, with a TTL."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.entries = {}  # name -> (contents, expires at)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.updated = 0
+
+    @staticmethod
+    def _ttl(config):
+        return float(str(config.get("ttl", "3600s")).rstrip("s"))
+
+    def create(self, model, config):
+        time.sleep(self.latency)
+        with self._lock:
+            self.created += 1
+            name = f"cachedContents/{new_id()}"
+            self.entries[name] = (list(config["contents"]), time.time() + self._ttl(config))
+        return SimpleNamespace(name=name, model=model)
+
+    def update(self, name, config):
+        with self._lock:
+            if name not in self.entries or self.entries[name][1] < time.time():
+                raise errors.ClientError(404, {"error": {"code": 404, "message": f"{name} not found", "status": "NOT_FOUND"}})
+            self.updated += 1
+            self.entries[name] = (self.entries[name][0], time.time() + self._ttl(config))
+        return SimpleNamespace(name=name)
+
+    def delete(self, name):
+        with self._lock:
+            self.entries.pop(name, None)
+
+    def contents(self, name):
+        with self._lock:
+            entry = self.entries.get(name)
+        if entry is None or entry[1] < time.time():
+            raise errors.ClientError(404, {"error": {"code": 404, "message": f"{name} not found", "status": "NOT_FOUND"}})
+        return entry[0]
+
+
+class FakeGenAIClient:
+    """
+    Stand-in for google.genai.Client. generate_content and generate_content_stream
+    return JSON that satisfies the requested response schema, built from the comment
+    IDs and usernames found in the request, after `latency` seconds (optionally
+    jittered). A fraction `error_rate` of calls fail with a 429 or 503 error.
+    Requests may reference prompts stored through `caches`; their tokens are
+    reported as cached input tokens.
+    """
+
+    COMMENT_PATTERN = re.compile(r"Comment ID: (\w+)\nUser \(([^)]*)\)")
+
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, stream_chunk_size=64, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stream_chunk_size = stream_chunk_size
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.models = SimpleNamespace(generate_content=self.generate_content,
+                                      generate_content_stream=self.generate_content_stream)
+        self.caches = FakeCaches()
+
+    def _delay(self):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.random.gauss(self.latency, self.latency * self.jitter))
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.failures += 1
+            code = self.random.choice((429, 503))
+        time.sleep(delay)
+        if fail:
+            error_class = errors.ClientError if code == 429 else errors.ServerError
+            raise error_class(code, {"error": {"code": code, "message": "Injected benchmark failure", "status": "UNAVAILABLE"}})
+
+    def _render(self, contents, config):
+        text = "\n".join(part for part in contents if isinstance(part, str)) if isinstance(contents, list) else str(contents)
+        comments = self.COMMENT_PATTERN.findall(text) or [("post", "op")]
+        return json.dumps(fake_from_schema(config["response_schema"], comments, self.random))
+
+    def _cached_contents(self, config):
+        return self.caches.contents(config["cached_content"]) if config.get("cached_content") else []
+
+    def _response(self, text, contents, cached_contents):
+        cached_tokens = sum(len(part) for part in cached_contents) // 4
+        prompt_tokens = sum(len(part) for part in contents if isinstance(part, str)) // 4 + cached_tokens
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens, cached_content_token_count=cached_tokens, candidates_token_count=len(text) // 4))
+
+    def generate_content(self, model, contents, config):
+        cached_contents = self._cached_contents(config)
+        self._delay()
+        return self._response(self._render(contents, config), contents, cached_contents)
+
+    def generate_content_stream(self, model, contents, config):
+        cached_contents = self._cached_contents(config)
+        text = self._render(contents, config)
+        self._delay()
+        chunks = [text[i:i + self.stream_chunk_size] for i in range(0, len(text), self.stream_chunk_size)]
+        for index, chunk in enumerate(chunks):
+            time.sleep(self.latency / max(1, len(chunks)))
+            if index == len(chunks) - 1:
+                yield self._response(chunk, contents, cached_contents)
+            else:
+                yield SimpleNamespace(text=chunk, usage_metadata=None)
+
+
+def fake_from_schema(schema, comments, rng, key=None, index=0):
+    """Builds a value matching a JSON schema, with one array item per comment for entry lists."""
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {name: fake_from_schema(subschema, comments, rng, name, index)
+                for name, subschema in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        count = len(comments) if key and key.endswith("_entries") and key != "arguments_entries" else rng.randint(1, 2)
+        return [fake_from_schema(schema["items"], comments, rng, key, i) for i in range(count)]
+    if schema_type == "string":
+        comment_id, username = comments[index % len(comments)]
+        if "enum" in schema:
+            return rng.choice(schema["enum"])
+        if key == "comment_id":
+            return comment_id
+        if key == "username":
+            return username
+        if key == "url":
+            return f"https://example.org/source/{rng.randrange(1000)}"
+        return f"Benchmark {key or 'text'} {rng.randrange(100000)}"
+    if schema_type in ("integer", "number"):
+        return rng.randint(0, 100)
+    if schema_type == "boolean":
+        return rng.random() < 0.5
+    return None
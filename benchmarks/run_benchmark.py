@@ -0,0 +1,196 @@
+"""
+Offline throughput benchmark for the bot.
+
+Runs RedditBot.run() end to end against the in-memory Reddit and Gemini
+stand-ins in fakes.py and a throwaway database, then reports mentions/sec,
+reply latency percentiles (mention yielded by the inbox stream -> reply posted),
+database growth and the bot's own stage metrics.
+
+Examples:
+    python benchmarks/run_benchmark.py --mentions 200 --workers 8
+    python benchmarks/run_benchmark.py --mentions 200 --workers 0 --gemini-latency 1.0
+    python benchmarks/run_benchmark.py --mentions 100 --repeat-rate 0.5 --json results.json
+    python benchmarks/run_benchmark.py --mentions-file recorded.jsonl
+
+A mentions file holds one JSON object per line with optional keys "command"
+(e.g. "!factcheck"), "thread" (index of the thread to mention in), "depth"
+(how deep in the thread's reply chain to reply) and "delay" (seconds since the
+previous mention).
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+from fakes import FakeGenAIClient, FakeReddit  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the bot against local Reddit and Gemini stand-ins.")
+    parser.add_argument("--mentions", type=int, default=100, help="Number of synthetic mentions to replay")
+    parser.add_argument("--threads", type=int, default=20, help="Number of distinct submissions mentions are spread over")
+    parser.add_argument("--depth", type=int, default=8, help="Length of the reply chain in each thread")
+    parser.add_argument("--comments-per-thread", type=int, default=50, help="Extra comments per thread besides the reply chain")
+    parser.add_argument("--comment-words", type=int, default=60, help="Words per generated comment body")
+    parser.add_argument("--commands", default="!analyze=6,!factcheck=3,!stats=1",
+                        help="Weighted command mix, e.g. '!analyze=1' or '!analyze=6,!factcheck=3,!stats=1'")
+    parser.add_argument("--repeat-rate", type=float, default=0.0,
+                        help="Fraction of mentions that repeat an earlier mention's thread position and command (exercises the caches)")
+    parser.add_argument("--arrival-interval", type=float, default=0.0, help="Seconds between mentions (0 replays them as a backlog)")
+    parser.add_argument("--mentions-file", help="JSONL file of recorded mentions to replay instead of synthetic ones")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="Mean seconds per Gemini call")
+    parser.add_argument("--gemini-jitter", type=float, default=0.2, help="Standard deviation of Gemini latency as a fraction of the mean")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Fraction of Gemini calls failing with 429/503")
+    parser.add_argument("--reddit-latency", type=float, default=0.05, help="Seconds per Reddit API call (forest load, info, context, reply)")
+    parser.add_argument("--workers", type=int, help="WORKER_COUNT for the run (default: the bot's own default)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--keep-db", action="store_true", help="Keep the temporary database directory")
+    return parser.parse_args()
+
+
+def parse_command_mix(spec):
+    commands, weights = [], []
+    for part in spec.split(","):
+        command, _, weight = part.strip().partition("=")
+        commands.append(command)
+        weights.append(float(weight or 1))
+    return commands, weights
+
+
+def build_workload(args, reddit):
+    """Creates the comment trees and queues the inbox mentions; returns the mention comments."""
+    rng = random.Random(args.seed)
+    threads = [reddit.add_thread(args.depth, args.comments_per_thread, body_words=args.comment_words)
+               for _ in range(args.threads)]
+    chains = [[c for c in submission.comment_list[:args.depth]] for submission, _ in threads]
+
+    if args.mentions_file:
+        with open(args.mentions_file, encoding='utf-8') as f:
+            recorded = [json.loads(line) for line in f if line.strip()]
+        for entry in recorded:
+            index = entry.get("thread", 0) % len(threads)
+            depth = min(entry.get("depth", args.depth), len(chains[index]))
+            parent = chains[index][depth - 1] if depth else None
+            reddit.add_mention(threads[index][0], parent, entry.get("command", "!analyze"), delay=entry.get("delay", 0.0))
+        return [mention for _, mention in reddit.mentions]
+
+    commands, weights = parse_command_mix(args.commands)
+    history = []
+    for _ in range(args.mentions):
+        if history and rng.random() < args.repeat_rate:
+            index, depth, command = rng.choice(history)
+        else:
+            index = rng.randrange(len(threads))
+            depth = rng.randint(1, len(chains[index])) if chains[index] else 0
+            command = rng.choices(commands, weights)[0]
+            history.append((index, depth, command))
+        parent = chains[index][depth - 1] if depth else None
+        reddit.add_mention(threads[index][0], parent, command, delay=args.arrival_interval)
+    return [mention for _, mention in reddit.mentions]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def db_size(path):
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal", f"{path}-shm") if os.path.exists(p))
+
+
+def main():
+    args = parse_args()
+    os.chdir(REPO_ROOT)  # Prompts and schemas are loaded relative to the repository root
+    os.environ.setdefault("DB_PASSPHRASE", "benchmark")
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    if args.workers is not None:
+        os.environ["WORKER_COUNT"] = str(args.workers)
+
+    from DatabaseHelper import DatabaseHelper
+    from Metrics import metrics
+    from RedditBot import RedditBot
+
+    temp_dir = tempfile.mkdtemp(prefix="bot-benchmark-")
+    db_path = os.path.join(temp_dir, "benchmark.db")
+
+    reddit = FakeReddit(latencies={"submission": args.reddit_latency, "info": args.reddit_latency, "context": args.reddit_latency,
+                                   "reply": args.reddit_latency},
+                        seed=args.seed)
+    gemini = FakeGenAIClient(latency=args.gemini_latency, jitter=args.gemini_jitter, error_rate=args.gemini_error_rate, seed=args.seed)
+    mentions = build_workload(args, reddit)
+
+    db = DatabaseHelper(db_path=db_path)
+    bot = RedditBot(reddit=reddit, genai_client=gemini, db=db)
+    db.close()  # Checkpoints the WAL so both measurements compare the same on-disk state
+    db_size_before = db_size(db_path)
+
+    start = time.perf_counter()
+    bot.run()
+    elapsed = time.perf_counter() - start
+
+    latencies = [m.replied_at - m.received_at for m in mentions if m.replied_at is not None and m.received_at is not None]
+    replied = len(latencies)
+    snapshot = metrics.snapshot()
+    results = {
+        "mentions": len(mentions),
+        "replied": replied,
+        "unanswered": len(mentions) - replied,
+        "elapsed_seconds": round(elapsed, 3),
+        "mentions_per_second": round(len(mentions) / elapsed, 3) if elapsed else None,
+        "reply_latency_seconds": {
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies) if latencies else None,
+        },
+        "db_bytes": {"before": db_size_before, "after": db_size(db_path), "growth": db_size(db_path) - db_size_before},
+        "gemini": {"calls": gemini.calls, "injected_failures": gemini.failures},
+        "reddit_calls": dict(sorted(reddit.calls.items())),
+        "counters": snapshot["counters"],
+        "stages": {stage: {key: histogram[key] for key in ("count", "p50", "p99", "max")}
+                   for stage, histogram in snapshot["latency_seconds"].items()},
+    }
+
+    print()
+    print(f"Mentions:          {results['mentions']} ({replied} replied, {results['unanswered']} unanswered)")
+    print(f"Elapsed:           {elapsed:.2f}s")
+    print(f"Throughput:        {results['mentions_per_second']} mentions/sec")
+    if latencies:
+        print(f"Reply latency:     p50 {results['reply_latency_seconds']['p50']:.3f}s, "
+              f"p99 {results['reply_latency_seconds']['p99']:.3f}s, max {results['reply_latency_seconds']['max']:.3f}s")
+    print(f"DB growth:         {results['db_bytes']['growth'] / 1024:.1f} KiB "
+          f"({results['db_bytes']['before']} -> {results['db_bytes']['after']} bytes)")
+    print(f"Gemini calls:      {gemini.calls} ({gemini.failures} injected failures)")
+    print(f"Reddit calls:      {results['reddit_calls']}")
+    print(f"Counters:          {results['counters']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.keep_db:
+        print(f"Database kept at {db_path}")
+    else:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    # A run in which commands failed measured the failures, not the bot
+    command_errors = {name: count for name, count in results['counters'].items()
+                      if name.startswith("command.") and name.endswith(".errors")}
+    if command_errors or results['unanswered']:
+        print(f"Benchmark run is invalid: {results['unanswered']} mentions unanswered, command errors: {command_errors}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
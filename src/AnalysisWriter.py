@@ -0,0 +1,97 @@
+import queue
+import threading
+import time
+
+from Metrics import metrics
+
+
+class AnalysisWriter:
+    """
+    Write-behind persistence for analyses, off the reply path.
+
+    put() turns an analysis into rows and queues them; a single writer thread stores
+    queued analyses in group commits of up to batch_size, waiting at most
+    flush_interval seconds after the first one for more to arrive. The queue holds
+    at most max_queue analyses, after which put() blocks until the writer catches up.
+
+    Until an analysis has been committed, its comment rows are kept in memory and
+    returned by pending_comment_analyses(), so incremental analysis sees them as if
+    they were already stored. close() writes everything still queued.
+    """
+
+    def __init__(self, db, batch_size=50, flush_interval=1.0, max_queue=1000):
+        self.DB = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # Seconds
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._pending = {}  # redditCommentID -> (analysisCommentID, CommentAnalysis row as a dict)
+        self._thread = threading.Thread(target=self._work, name="analysis-writer", daemon=True)
+        self._thread.start()
+        metrics.register_gauge("db.writer.queue_depth", self.queue_depth)
+
+    def put(self, original_post, triggerCommentID, analysisCommentID, analysis):
+        """Queues an analysis for storage, blocking while the queue is full."""
+        # Rows are built here, so the writer never touches PRAW objects (which may fetch lazily)
+        rows = self.DB.analysis_rows(original_post, triggerCommentID, analysisCommentID, analysis)
+        with self._lock:
+            for row in rows[1]:
+                self._pending[row['redditCommentID']] = (analysisCommentID, row)
+        with metrics.timer("db.writer.enqueue"):
+            self.queue.put(rows)
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def pending_comment_analyses(self, comment_ids):
+        """Returns the queued, not yet committed comment rows for the given IDs, keyed by redditCommentID."""
+        with self._lock:
+            return {comment_id: self._pending[comment_id][1] for comment_id in comment_ids if comment_id in self._pending}
+
+    def _work(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            stopping = batch[-1] is None
+            analyses = [rows for rows in batch if rows is not None]
+            if analyses:
+                self._store(analyses)
+            for _ in batch:
+                self.queue.task_done()
+            if stopping:
+                return
+
+    def _store(self, analyses):
+        try:
+            with metrics.timer("db.writer.batch"):
+                self.DB.store_analyses(analyses)
+            print(f"Stored a batch of {len(analyses)} analyses.")
+        except Exception as e:
+            # Store one by one, so a single bad analysis does not cost the rest of the batch
+            print(f"Error storing a batch of {len(analyses)} analyses, retrying them one at a time: {e}")
+            for rows in analyses:
+                try:
+                    self.DB.store_analyses([rows])
+                except Exception as e:
+                    print(f"Error storing analysis '{rows[0]['analysisCommentID']}': {e}")
+        metrics.increment("db.writer.batches")
+        metrics.increment("db.writer.analyses", len(analyses))
+
+        with self._lock:
+            for context_row, comment_rows in analyses:
+                for row in comment_rows:
+                    # A newer analysis of the same comment may have been queued meanwhile
+                    if self._pending.get(row['redditCommentID'], (None,))[0] == context_row['analysisCommentID']:
+                        del self._pending[row['redditCommentID']]
+
+    def close(self):
+        """Writes every queued analysis, then stops the writer thread."""
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
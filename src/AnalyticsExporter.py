@@ -0,0 +1,313 @@
+import argparse
+import csv
+import json
+import os
+from collections import namedtuple
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+# sql takes the same filter parameters for every report; numeric lists the columns stored as numbers in Parquet
+Report = namedtuple("Report", ["description", "sql", "numeric"])
+
+# Every report accepts an optional subreddit and author filter (NULL matches everything)
+FILTERS = """
+    (:subreddit IS NULL OR ac.redditCommunity = :subreddit)
+    AND (:author IS NULL OR ca.author = :author)
+"""
+
+# Recent comment analyses plus the monthly rollups of the ones removed by retention, one row per
+# (author, subreddit, month, argument type, fallacy type) group of detail rows
+COMMENT_COUNTS = f"""
+    WITH counts AS (
+        SELECT
+            ca.author,
+            ac.redditCommunity,
+            strftime('%Y-%m', ca.createdAt, 'unixepoch') AS month,
+            ca.argument_type,
+            ca.fallacy_type,
+            COUNT(*) AS comments
+        FROM CommentAnalysis AS ca
+        JOIN AnalysisContext AS ac ON ca.analysisCommentID = ac.analysisCommentID
+        WHERE {FILTERS}
+        GROUP BY 1, 2, 3, 4, 5
+        UNION ALL
+        SELECT author, redditCommunity, month, argument_type, NULLIF(fallacy_type, ''), comments
+        FROM MonthlyCommentStats
+        WHERE (:subreddit IS NULL OR redditCommunity = :subreddit)
+            AND (:author IS NULL OR author = :author)
+    )
+"""
+
+# Months are compared as YYYY-MM text; NULL leaves the range open
+MONTHS = "(:since IS NULL OR month >= :since) AND (:until IS NULL OR month <= :until)"
+
+REPORTS = {
+    "comments": Report(
+        "One row per analyzed comment with its thread context (recent analyses only; older ones are in the rollups).",
+        f"""
+            SELECT
+                ca.redditCommentID,
+                ca.analysisCommentID,
+                ca.author,
+                ca.argument_type,
+                ca.fallacy_type,
+                ca.comment_summary,
+                ca.flaw_description,
+                ac.triggerCommentID,
+                ac.redditThreadID,
+                ac.redditCommunity,
+                ac.overall_argument_type AS context_overall_argument_type,
+                datetime(ca.createdAt, 'unixepoch') AS createdAt
+            FROM CommentAnalysis AS ca
+            JOIN AnalysisContext AS ac ON ca.analysisCommentID = ac.analysisCommentID
+            WHERE {FILTERS}
+            ORDER BY ca.rowid;
+        """,
+        (),
+    ),
+    "fallacy_frequency": Report(
+        "Number of comments per fallacy type in each subreddit.",
+        f"""
+            {COMMENT_COUNTS}
+            SELECT
+                redditCommunity,
+                COALESCE(fallacy_type, 'unspecified') AS fallacy_type,
+                SUM(comments) AS comments
+            FROM counts
+            WHERE argument_type = 'fallacy' AND {MONTHS}
+            GROUP BY redditCommunity, COALESCE(fallacy_type, 'unspecified')
+            ORDER BY redditCommunity, comments DESC;
+        """,
+        ("comments",),
+    ),
+    "argument_types": Report(
+        "Number of comments per argument type in each subreddit.",
+        f"""
+            {COMMENT_COUNTS}
+            SELECT
+                redditCommunity,
+                argument_type,
+                SUM(comments) AS comments
+            FROM counts
+            WHERE {MONTHS}
+            GROUP BY redditCommunity, argument_type
+            ORDER BY redditCommunity, comments DESC;
+        """,
+        ("comments",),
+    ),
+    "user_scores": Report(
+        "Users ranked by score (+1 per valid argument, -1 per fallacy, as in !stats).",
+        f"""
+            {COMMENT_COUNTS}
+            SELECT
+                author,
+                SUM(comments) AS analyzed,
+                SUM(CASE WHEN argument_type = 'valid_argument' THEN comments ELSE 0 END) AS valid_arguments,
+                SUM(CASE WHEN argument_type = 'fallacy' THEN comments ELSE 0 END) AS fallacies,
+                SUM(CASE WHEN argument_type = 'no_argument_found' THEN comments ELSE 0 END) AS no_arguments,
+                SUM(CASE WHEN argument_type = 'valid_argument' THEN comments
+                         WHEN argument_type = 'fallacy' THEN -comments ELSE 0 END) AS score
+            FROM counts
+            WHERE author != '[Deleted User]' AND {MONTHS}
+            GROUP BY author
+            HAVING SUM(comments) >= :min_comments
+            ORDER BY score DESC, analyzed DESC, author;
+        """,
+        ("analyzed", "valid_arguments", "fallacies", "no_arguments", "score"),
+    ),
+    "discussion_types": Report(
+        "Number of analyzed threads per overall discussion type in each subreddit "
+        "(with --author, only recent analyses can be matched to the user).",
+        f"""
+            WITH counts AS (
+                SELECT
+                    ac.redditCommunity,
+                    strftime('%Y-%m', ac.createdAt, 'unixepoch') AS month,
+                    ac.overall_argument_type,
+                    COUNT(*) AS analyses
+                FROM AnalysisContext AS ac
+                WHERE (:subreddit IS NULL OR ac.redditCommunity = :subreddit)
+                    AND (:author IS NULL OR EXISTS (
+                        SELECT 1 FROM CommentAnalysis AS ca
+                        WHERE ca.analysisCommentID = ac.analysisCommentID AND ca.author = :author
+                    ))
+                GROUP BY 1, 2, 3
+                UNION ALL
+                SELECT redditCommunity, month, overall_argument_type, analyses
+                FROM MonthlyAnalysisStats
+                WHERE (:subreddit IS NULL OR redditCommunity = :subreddit) AND :author IS NULL
+            )
+            SELECT
+                redditCommunity,
+                overall_argument_type,
+                SUM(analyses) AS analyses
+            FROM counts
+            WHERE {MONTHS}
+            GROUP BY redditCommunity, overall_argument_type
+            ORDER BY redditCommunity, analyses DESC;
+        """,
+        ("analyses",),
+    ),
+    "monthly_argument_types": Report(
+        "Trend: number of comments per argument type in each subreddit and month.",
+        f"""
+            {COMMENT_COUNTS}
+            SELECT
+                month,
+                redditCommunity,
+                argument_type,
+                SUM(comments) AS comments
+            FROM counts
+            WHERE {MONTHS}
+            GROUP BY month, redditCommunity, argument_type
+            ORDER BY month, redditCommunity, comments DESC;
+        """,
+        ("comments",),
+    ),
+    "monthly_fallacies": Report(
+        "Trend: number of comments per fallacy type in each subreddit and month.",
+        f"""
+            {COMMENT_COUNTS}
+            SELECT
+                month,
+                redditCommunity,
+                COALESCE(fallacy_type, 'unspecified') AS fallacy_type,
+                SUM(comments) AS comments
+            FROM counts
+            WHERE argument_type = 'fallacy' AND {MONTHS}
+            GROUP BY month, redditCommunity, COALESCE(fallacy_type, 'unspecified')
+            ORDER BY month, redditCommunity, comments DESC;
+        """,
+        ("comments",),
+    ),
+}
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+
+class AnalyticsExporter:
+    """
+    Bulk, read-only access to the analysis database for community-level analytics.
+
+    Each report is a single SQL query; aggregation (counts, scores, ranking) runs
+    inside SQLite over the recent analyses plus the monthly rollups that retention
+    leaves of older ones, and results are streamed in chunks of chunk_size rows via
+    DatabaseHelper.iter_query, so memory use does not grow with the database.
+    Reports can be iterated as dicts or written to CSV, JSON Lines or Parquet
+    (Parquet requires pyarrow).
+    """
+
+    def __init__(self, db, chunk_size=1000):
+        self.DB = db
+        self.chunk_size = chunk_size
+
+    def _query(self, report, subreddit=None, author=None, min_comments=1, since=None, until=None):
+        if report not in REPORTS:
+            raise ValueError(f"Unknown report '{report}'. Available reports: {', '.join(REPORTS)}")
+        params = {"subreddit": subreddit, "author": author, "min_comments": min_comments, "since": since, "until": until}
+        return self.DB.iter_query(REPORTS[report].sql, params, self.chunk_size)
+
+    def iter_report(self, report, **filters):
+        """Yields the report's rows as dicts, one chunk at a time from the database."""
+        for columns, rows in self._query(report, **filters):
+            for row in rows:
+                yield dict(zip(columns, row))
+
+    def export(self, report, output, format=None, **filters):
+        """
+        Writes a report to the output path and returns the number of rows written, or
+        None if the export failed. The format defaults to the file extension.
+        """
+        format = format or os.path.splitext(output)[1].lstrip('.').lower()
+        if format not in FORMATS:
+            print(f"Unsupported export format '{format}'. Use one of: {', '.join(FORMATS)}")
+            return None
+        if format == "parquet" and pyarrow is None:
+            print("Parquet export requires pyarrow (pip install pyarrow).")
+            return None
+
+        try:
+            chunks = self._query(report, **filters)
+            if format == "parquet":
+                row_count = self._write_parquet(chunks, output, REPORTS[report].numeric)
+            else:
+                with open(output, 'w', encoding='utf-8', newline='') as f:
+                    row_count = self._write_text(chunks, f, format)
+        except Exception as e:
+            print(f"Error exporting report '{report}' to '{output}': {e}")
+            return None
+
+        print(f"Exported {row_count} rows of '{report}' to {output}")
+        return row_count
+
+    def _write_text(self, chunks, f, format):
+        row_count = 0
+        writer = None
+        for columns, rows in chunks:
+            if format == "csv":
+                if writer is None:
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                    f.write("\n")
+            row_count += len(rows)
+        return row_count
+
+    def _write_parquet(self, chunks, path, numeric):
+        # Types are fixed up front: inferring them per chunk breaks on columns that start out all NULL
+        row_count = 0
+        writer = None
+        try:
+            for columns, rows in chunks:
+                if writer is None:
+                    schema = pyarrow.schema([
+                        (column, pyarrow.int64() if column in numeric else pyarrow.string()) for column in columns
+                    ])
+                    writer = pyarrow.parquet.ParquetWriter(path, schema)
+                if rows:
+                    table = pyarrow.Table.from_pydict(
+                        {column: [row[index] for row in rows] for index, column in enumerate(columns)}, schema=schema)
+                    writer.write_table(table)
+                row_count += len(rows)
+        finally:
+            if writer is not None:
+                writer.close()
+        return row_count
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from DatabaseHelper import DatabaseHelper
+
+    parser = argparse.ArgumentParser(
+        description="Export analytics reports from the analysis database.",
+        epilog="Reports: " + "; ".join(f"{name}: {report.description}" for name, report in REPORTS.items()))
+    parser.add_argument("report", choices=sorted(REPORTS), help="Report to export")
+    parser.add_argument("output", help="Output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--format", choices=FORMATS, help="Output format (default: from the file extension)")
+    parser.add_argument("--subreddit", help="Only include analyses from this subreddit")
+    parser.add_argument("--author", help="Only include comments by this user")
+    parser.add_argument("--min-comments", type=int, default=1, help="user_scores: minimum analyzed comments per user")
+    parser.add_argument("--since", metavar="YYYY-MM", help="Aggregate reports: first month to include")
+    parser.add_argument("--until", metavar="YYYY-MM", help="Aggregate reports: last month to include")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows fetched from the database per chunk")
+    args = parser.parse_args()
+
+    db = DatabaseHelper()
+    try:
+        exported = AnalyticsExporter(db, chunk_size=args.chunk_size).export(
+            args.report, args.output, format=args.format,
+            subreddit=args.subreddit, author=args.author, min_comments=args.min_comments,
+            since=args.since, until=args.until)
+    finally:
+        db.close()
+    exit(0 if exported is not None else 1)
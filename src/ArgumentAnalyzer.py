@@ -1,8 +1,11 @@
+import argparse
+import multiprocessing
 import os
+import signal
 
 from dotenv import load_dotenv
 
-from RedditBot import RedditBot
+from RedditBot import RedditBot, createRedditClient
 
 load_dotenv()
 # It's crucial that this environment variable is set before running the script
@@ -13,12 +16,92 @@ REDDIT_USERNAME = os.getenv("REDDIT_USERNAME")
 REDDIT_PASSWORD = os.getenv("REDDIT_PASSWORD")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+SHARD_CREDENTIALS = ("CLIENT_ID", "CLIENT_SECRET", "USERNAME", "PASSWORD")
+
+
+def configuredShards():
+    """Returns the shard numbers 1..n with REDDIT_SHARD_<n>_* credentials set, stopping at the first gap."""
+    shards = []
+    while os.getenv(f"REDDIT_SHARD_{len(shards) + 1}_CLIENT_ID"):
+        shards.append(len(shards) + 1)
+    return shards
+
+
+def missingShardCredentials(shard):
+    return [f"REDDIT_SHARD_{shard}_{name}" for name in SHARD_CREDENTIALS if not os.getenv(f"REDDIT_SHARD_{shard}_{name}")]
+
+
+def runShardWorker(shard):
+    load_dotenv()  # Worker processes may be spawned without the parent's environment loaded
+    RedditBot(reddit=createRedditClient(shard)).runShardWorker(shard)
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Reddit bot that analyzes arguments in comment threads.")
+    parser.add_argument(
+        "--mode", choices=("single", "coordinator", "worker", "sharded"), default="single",
+        help="single: one process reads the inbox and runs every job (default). "
+             "coordinator: read the inbox and queue jobs only. "
+             "worker: run queued jobs with the credentials of --shard. "
+             "sharded: a coordinator plus one worker process per configured shard."
+    )
+    parser.add_argument("--shard", type=int, help="Shard number for --mode worker (uses REDDIT_SHARD_<n>_* credentials)")
+    parser.add_argument("--shards", type=int,
+                        help="Number of worker processes for --mode sharded (default: every configured REDDIT_SHARD_<n>)")
+    return parser.parse_args()
+
+
 # --- Main execution block ---
 if __name__ == "__main__":
-    if not all([REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USERNAME, REDDIT_PASSWORD, GOOGLE_API_KEY]):
+    args = parseArguments()
+
+    if not GOOGLE_API_KEY:
+        print("ERROR: GOOGLE_API_KEY is not set.")
+        exit(1)
+
+    if args.mode in ("single", "coordinator", "sharded") and not all([REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USERNAME, REDDIT_PASSWORD]):
         print(
             "ERROR: One or more environment variables are not set. Please set REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USERNAME, REDDIT_PASSWORD, and GOOGLE_API_KEY.")
         exit(1)
 
-    bot = RedditBot()
-    bot.run()
+    if args.mode == "worker":
+        if args.shard is None:
+            print("ERROR: --mode worker requires --shard <n>.")
+            exit(1)
+        shards = [args.shard]
+    elif args.mode == "sharded":
+        shards = list(range(1, args.shards + 1)) if args.shards else configuredShards()
+        if not shards:
+            print("ERROR: --mode sharded needs REDDIT_SHARD_1_CLIENT_ID etc. or --shards <n>.")
+            exit(1)
+    else:
+        shards = []
+
+    missing = [name for shard in shards for name in missingShardCredentials(shard)]
+    if missing:
+        print(f"ERROR: Missing shard credentials: {', '.join(missing)}")
+        exit(1)
+
+    if args.mode == "single":
+        bot = RedditBot()
+        bot.run()
+    elif args.mode == "coordinator":
+        RedditBot().runCoordinator()
+    elif args.mode == "worker":
+        runShardWorker(args.shard)
+    else:
+        processes = [multiprocessing.Process(target=runShardWorker, args=(shard,), name=f"shard-{shard}") for shard in shards]
+        for process in processes:
+            process.start()
+        print(f"Started {len(processes)} shard worker processes")
+        try:
+            RedditBot().runCoordinator()
+        finally:
+            # Workers finish the jobs in flight on SIGINT; anything still running after a minute is stopped
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGINT)
+            for process in processes:
+                process.join(timeout=60)
+                if process.is_alive():
+                    process.terminate()
@@ -1,56 +1,230 @@
+import json
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
 from sqlcipher3 import dbapi2 as sqlite3
 
+from Metrics import metrics
+
+# database.db in the repository root, independent of the working directory; DB_PATH overrides it
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database.db")
+
+
 class DatabaseHelper:
-    def __init__(self):
+    # Stored in PRAGMA user_version; init_db migrates older databases step by step (see migrate)
+    SCHEMA_VERSION = 2
+
+    def __init__(self, db_path=None, pool_size=None):
+        # Read here rather than at import, so a DB_PATH loaded from .env after the import still applies
+        self.db_path = db_path or os.getenv("DB_PATH", DEFAULT_DB_PATH)
+        # Keying a SQLCipher connection runs PBKDF2, so connections are keyed once and reused
+        self.pool_size = pool_size or int(os.getenv("DB_POOL_SIZE", "4"))
+        self._pool = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self._connection_count = 0
         self.init_db()
 
-    # --- Helper function to get a database connection ---
+    # --- Helper function to open a new keyed database connection ---
     def get_db_connection(self):
-        conn = sqlite3.connect("../database.db")
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
         cursor = conn.cursor()
 
-        cursor.execute(f"PRAGMA key='{os.getenv('DB_PASSPHRASE')}';")
+        passphrase = (os.getenv('DB_PASSPHRASE') or '').replace("'", "''")
+        cursor.execute(f"PRAGMA key='{passphrase}';")
+        cursor.execute("PRAGMA journal_mode=WAL;")  # Readers don't block the writer
+        cursor.execute("PRAGMA synchronous=NORMAL;")  # Safe with WAL, avoids an fsync per commit
+        cursor.execute("PRAGMA cache_size=-16000;")  # 16 MB page cache per connection
+        cursor.execute("PRAGMA busy_timeout=5000;")
 
         return conn
 
+    # --- Pooled connection access, safe to use from concurrent workers ---
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a keyed connection from the pool, opening a new one while fewer than
+        pool_size exist. Uncommitted work is rolled back if the block raises.
+        """
+        conn = None
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                if self._connection_count < self.pool_size:
+                    self._connection_count += 1
+                    try:
+                        conn = self.get_db_connection()
+                    except Exception:
+                        self._connection_count -= 1
+                        raise
+            if conn is None:
+                conn = self._pool.get()
+
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        """Closes every pooled connection."""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._pool_lock:
+                self._connection_count -= 1
+
     # --- Database Initialization Function ---
     def init_db(self):  # Renamed to init_db for clarity, good practice
         """Initializes database tables for AnalysisContext and CommentAnalysis."""
-        conn = None  # Initialize conn to None for finally block
         try:
-            conn = self.get_db_connection()  # Use the helper function
-            cur = conn.cursor()
+            with self.connection() as conn:
+                cur = conn.cursor()
+
+                cur.execute("""CREATE TABLE IF NOT EXISTS AnalysisContext (
+                    analysisCommentID VARCHAR(255) PRIMARY KEY,
+                    triggerCommentID VARCHAR(255) NOT NULL,
+                    redditThreadID VARCHAR(255) NOT NULL,
+                    redditCommunity VARCHAR(255) NOT NULL, -- Correctly included in CREATE TABLE
+                    overall_summary TEXT,
+                    overall_argument_type VARCHAR(255),
+                    createdAt REAL -- Unix time the analysis was stored
+                );""")
 
-            cur.execute("""CREATE TABLE IF NOT EXISTS AnalysisContext (
-                analysisCommentID VARCHAR(255) PRIMARY KEY,
-                triggerCommentID VARCHAR(255) NOT NULL,
-                redditThreadID VARCHAR(255) NOT NULL,
-                redditCommunity VARCHAR(255) NOT NULL, -- Correctly included in CREATE TABLE
-                overall_summary TEXT,
-                overall_argument_type VARCHAR(255)
-            );""")
-
-            cur.execute("""CREATE TABLE IF NOT EXISTS CommentAnalysis (
-                redditCommentID VARCHAR(255) PRIMARY KEY,
-                analysisCommentID VARCHAR(255) NOT NULL,
-                author VARCHAR(255),
-                comment_summary TEXT,
-                argument_type VARCHAR(255),
-                fallacy_type VARCHAR(255),
-                flaw_description TEXT,
+                cur.execute("""CREATE TABLE IF NOT EXISTS CommentAnalysis (
+                    redditCommentID VARCHAR(255) PRIMARY KEY,
+                    analysisCommentID VARCHAR(255) NOT NULL,
+                    author VARCHAR(255),
+                    comment_summary TEXT,
+                    argument_type VARCHAR(255),
+                    fallacy_type VARCHAR(255),
+                    flaw_description TEXT,
+                    createdAt REAL, -- Unix time the row was stored
     
-                FOREIGN KEY (analysisCommentID) REFERENCES AnalysisContext(analysisCommentID)
-            );""")
-            conn.commit()
-            print("Database tables initialized successfully.")
+                    FOREIGN KEY (analysisCommentID) REFERENCES AnalysisContext(analysisCommentID)
+                );""")
+
+                # author leads the composite index, so it serves both the per-user filter and GROUP BY argument_type
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_commentanalysis_author ON CommentAnalysis(author, argument_type);")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_commentanalysis_analysis ON CommentAnalysis(analysisCommentID);")
+                # Community-level analytics filter and group on the subreddit
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_analysiscontext_community ON AnalysisContext(redditCommunity, overall_argument_type);")
+
+                cur.execute("""CREATE TABLE IF NOT EXISTS Jobs (
+                    triggerCommentID VARCHAR(255) PRIMARY KEY, -- One job per trigger comment, so replays are ignored
+                    command VARCHAR(255) NOT NULL,
+                    args TEXT, -- JSON list of command arguments
+                    state VARCHAR(16) NOT NULL, -- queued, running, replied or failed
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lastError TEXT,
+                    replyCommentID VARCHAR(255),
+                    createdAt REAL NOT NULL,
+                    updatedAt REAL NOT NULL,
+                    threadID VARCHAR(255), -- Submission ID; jobs in one thread never run concurrently
+                    worker VARCHAR(255) -- Shard worker that claimed the job
+                );""")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON Jobs(state);")
+
+                cur.execute("""CREATE TABLE IF NOT EXISTS ResponseCache (
+                    cacheKey VARCHAR(64) PRIMARY KEY, -- SHA-256 of model, prompt, schema and contents
+                    fingerprint VARCHAR(64) NOT NULL, -- Hash of prompts/ and schemas/ when the entry was written
+                    response TEXT NOT NULL,
+                    createdAt REAL NOT NULL,
+                    lastAccess REAL NOT NULL
+                );""")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_responsecache_lastaccess ON ResponseCache(lastAccess);")
+
+                cur.execute("""CREATE TABLE IF NOT EXISTS FactCheckCache (
+                    claimKey VARCHAR(64) PRIMARY KEY, -- SHA-256 of the normalized claim and arguments
+                    claim TEXT NOT NULL,
+                    result TEXT NOT NULL, -- fact_check_output_schema JSON
+                    createdAt REAL NOT NULL
+                );""")
+
+                # Monthly counts of the CommentAnalysis and AnalysisContext rows removed by apply_retention
+                cur.execute("""CREATE TABLE IF NOT EXISTS MonthlyCommentStats (
+                    author VARCHAR(255) NOT NULL,
+                    redditCommunity VARCHAR(255) NOT NULL,
+                    month CHAR(7) NOT NULL, -- YYYY-MM (UTC) of the rows' createdAt
+                    argument_type VARCHAR(255) NOT NULL,
+                    fallacy_type VARCHAR(255) NOT NULL DEFAULT '', -- '' when the rows had none
+                    comments INTEGER NOT NULL,
+                    PRIMARY KEY (author, redditCommunity, month, argument_type, fallacy_type)
+                );""")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_monthlycommentstats_community ON MonthlyCommentStats(redditCommunity, month);")
+                cur.execute("""CREATE TABLE IF NOT EXISTS MonthlyAnalysisStats (
+                    redditCommunity VARCHAR(255) NOT NULL,
+                    month CHAR(7) NOT NULL,
+                    overall_argument_type VARCHAR(255) NOT NULL,
+                    analyses INTEGER NOT NULL,
+                    PRIMARY KEY (redditCommunity, month, overall_argument_type)
+                );""")
+                conn.commit()
+                self.migrate(conn)
+                print("Database tables initialized successfully.")
+            self.enable_incremental_vacuum()
         except Exception as e:
             print(f"Error during database initialization: {e}")
             # Optionally re-raise the exception if the bot cannot proceed without DB
             # raise
-        finally:
-            if conn:
-                conn.close()  # Ensure connection is closed even if an error occurs
+
+    def migrate(self, conn):
+        """
+        Upgrades a database created by an older version to SCHEMA_VERSION, one
+        PRAGMA user_version step at a time. Every step is safe to repeat, so a database
+        whose tables were just created at the current shape passes through unchanged.
+        """
+        cur = conn.cursor()
+        # Several processes may start at once; the write lock makes them migrate one after another
+        cur.execute("BEGIN IMMEDIATE;")
+        version = cur.execute("PRAGMA user_version;").fetchone()[0]
+        for target, migration in ((1, self._migrate_job_sharding), (2, self._migrate_created_at)):
+            if version < target:
+                migration(cur)
+                cur.execute(f"PRAGMA user_version = {target};")
+                print(f"Migrated database schema to version {target}.")
+        conn.commit()
+
+    @staticmethod
+    def _add_column(cur, table, column, definition):
+        if column not in {row[1] for row in cur.execute(f"PRAGMA table_info({table});").fetchall()}:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+
+    def _migrate_job_sharding(self, cur):
+        # Jobs tables created before sharding lack these columns
+        self._add_column(cur, "Jobs", "threadID", "VARCHAR(255)")
+        self._add_column(cur, "Jobs", "worker", "VARCHAR(255)")
+
+    def _migrate_created_at(self, cur):
+        self._add_column(cur, "AnalysisContext", "createdAt", "REAL")
+        self._add_column(cur, "CommentAnalysis", "createdAt", "REAL")
+        # The real age of existing rows is unknown; dating them to the upgrade keeps them for a full retention period
+        now = time.time()
+        cur.execute("UPDATE AnalysisContext SET createdAt = ? WHERE createdAt IS NULL;", (now,))
+        cur.execute("UPDATE CommentAnalysis SET createdAt = ? WHERE createdAt IS NULL;", (now,))
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_analysiscontext_createdat ON AnalysisContext(createdAt);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_commentanalysis_createdat ON CommentAnalysis(createdAt);")
+
+    def enable_incremental_vacuum(self):
+        """
+        Switches the file to incremental auto-vacuum, so compact() can return the pages freed
+        by retention to the filesystem. An existing file is rebuilt once with VACUUM for this.
+        """
+        with self.connection() as conn:
+            cur = conn.cursor()
+            if cur.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2:  # 2 = INCREMENTAL
+                return
+            print("Enabling incremental vacuum; rebuilding the database file once, this may take a while.")
+            cur.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+            cur.execute("VACUUM;")
 
 
     # --- Function to Store Analysis ---
@@ -64,109 +238,507 @@ class DatabaseHelper:
             analysisCommentID: A unique ID for this specific analysis instance.
             analysis: The parsed JSON output from the Gemini API.
         """
-        conn = None  # Initialize conn to None
         try:
-            conn = self.get_db_connection()  # Get a new connection for this operation
-            cur = conn.cursor()
-
-            # Fix: Mismatch in INSERT statement for AnalysisContext
-            # Ensure column names match the VALUES and the number of placeholders
-            cur.execute("""
-                INSERT OR REPLACE INTO AnalysisContext (
-                    analysisCommentID, 
-                    triggerCommentID, 
-                    redditThreadID, 
-                    redditCommunity, -- Added this column to the INSERT list
-                    overall_summary, 
-                    overall_argument_type
-                ) VALUES (?, ?, ?, ?, ?, ?); -- Ensure 6 placeholders for 6 columns
-            """, (
-                analysisCommentID,
-                triggerCommentID,
-                original_post.id,  # This is the redditThreadID (Submission ID)
-                original_post.subreddit.display_name,  # Use display_name for community
-                analysis["overall_summary"],
-                analysis["overall_argument_type"]
-            ))
-
-            if analysis['analysis_entries']:
-                for entry in analysis['analysis_entries']:
-                    # The 'fallacy_type' and 'flaw_description' might be None/empty strings if not a fallacy.
-                    # SQLite handles None as NULL, which is fine for TEXT fields.
-                    # Ensure author exists (not deleted) before getting name
-                    author_name = entry["username"] if entry["username"] else '[Deleted User]'
-
-                    cur.execute("""
-                        INSERT OR REPLACE INTO CommentAnalysis (
-                            redditCommentID, 
-                            analysisCommentID, 
-                            author, 
-                            comment_summary, 
-                            argument_type, 
-                            fallacy_type, 
-                            flaw_description
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?);
-                    """, (
-                        entry["comment_id"],  # Make sure your analysis_output provides this
-                        analysisCommentID,
-                        author_name,
-                        entry["comment_summary"],
-                        entry["argument_type"],
-                        entry.get("fallacy_type", None),  # Use .get() with default None for optional fields
-                        entry.get("flaw_description", None)  # Use .get() with default None for optional fields
-                    ))
-
-            conn.commit()
+            with metrics.timer("db.store_analysis"):
+                self.store_analyses([self.analysis_rows(original_post, triggerCommentID, analysisCommentID, analysis)])
             print(f"Analysis '{analysisCommentID}' stored successfully.")
         except Exception as e:
             print(f"Error storing analysis '{analysisCommentID}': {e}")
             # Consider logging the full traceback here for debugging: traceback.print_exc()
-            # Optionally rollback if only partial data was committed
-            if conn:
-                conn.rollback()
-        finally:
-            if conn:
-                conn.close()  # Ensure connection is closed
+
+    @staticmethod
+    def analysis_rows(original_post, triggerCommentID, analysisCommentID, analysis):
+        """Returns (AnalysisContext row, list of CommentAnalysis rows) as dicts of column values."""
+        now = time.time()
+        context_row = {
+            "analysisCommentID": analysisCommentID,
+            "triggerCommentID": triggerCommentID,
+            "redditThreadID": original_post.id,  # Submission ID
+            "redditCommunity": original_post.subreddit.display_name,  # Use display_name for community
+            "overall_summary": analysis["overall_summary"],
+            "overall_argument_type": analysis["overall_argument_type"],
+            "createdAt": now,
+        }
+        comment_rows = [{
+            "redditCommentID": entry["comment_id"],
+            "analysisCommentID": analysisCommentID,
+            # Ensure author exists (not deleted) before getting name
+            "author": entry["username"] if entry["username"] else '[Deleted User]',
+            "comment_summary": entry["comment_summary"],
+            "argument_type": entry["argument_type"],
+            # The 'fallacy_type' and 'flaw_description' might be None/empty strings if not a fallacy.
+            "fallacy_type": entry.get("fallacy_type", None),
+            "flaw_description": entry.get("flaw_description", None),
+            "createdAt": now,
+        } for entry in analysis['analysis_entries'] or []]
+        return context_row, comment_rows
+
+    def store_analyses(self, analyses):
+        """
+        Stores (context row, comment rows) pairs from analysis_rows in one transaction, with
+        one executemany per table. Errors are raised, so the caller can decide what to retry.
+        """
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany("""
+                INSERT OR REPLACE INTO AnalysisContext (
+                    analysisCommentID, triggerCommentID, redditThreadID, redditCommunity,
+                    overall_summary, overall_argument_type, createdAt
+                ) VALUES (
+                    :analysisCommentID, :triggerCommentID, :redditThreadID, :redditCommunity,
+                    :overall_summary, :overall_argument_type, :createdAt
+                );
+            """, [context_row for context_row, _ in analyses])
+            cur.executemany("""
+                INSERT OR REPLACE INTO CommentAnalysis (
+                    redditCommentID, analysisCommentID, author, comment_summary,
+                    argument_type, fallacy_type, flaw_description, createdAt
+                ) VALUES (
+                    :redditCommentID, :analysisCommentID, :author, :comment_summary,
+                    :argument_type, :fallacy_type, :flaw_description, :createdAt
+                );
+            """, [row for _, comment_rows in analyses for row in comment_rows])
+            conn.commit()
 
     def get_user_analysis_history(self,username):
-        conn = None
         results = []
         try:
-            conn = self.get_db_connection()
-            conn.row_factory = sqlite3.Row # This allows access to columns by name
-            cur = conn.cursor()
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row # This allows access to columns by name
 
-            cur.execute("""
-                SELECT
-                    ca.redditCommentID,
-                    ca.analysisCommentID,
-                    ca.argument_type,
-                    ca.fallacy_type,
-                    ac.triggerCommentID,
-                    ac.redditThreadID,
-                    ac.redditCommunity,
-                    ac.overall_argument_type AS context_overall_argument_type -- Alias
-                FROM
-                    CommentAnalysis AS ca
-                JOIN
-                    AnalysisContext AS ac ON ca.analysisCommentID = ac.analysisCommentID
-                WHERE
-                    ca.author = ?
-                ORDER BY
-                    ac.redditThreadID, ca.redditCommentID; -- Order for better readability
-            """, (username,))
-
-            # Fetch all results
-            rows = cur.fetchall()
-
-            # Convert rows to a list of dictionaries for easier use
-            for row in rows:
-                results.append(dict(row))
+                cur.execute("""
+                    SELECT
+                        ca.redditCommentID,
+                        ca.analysisCommentID,
+                        ca.argument_type,
+                        ca.fallacy_type,
+                        ac.triggerCommentID,
+                        ac.redditThreadID,
+                        ac.redditCommunity,
+                        ac.overall_argument_type AS context_overall_argument_type -- Alias
+                    FROM
+                        CommentAnalysis AS ca
+                    JOIN
+                        AnalysisContext AS ac ON ca.analysisCommentID = ac.analysisCommentID
+                    WHERE
+                        ca.author = ?
+                    ORDER BY
+                        ac.redditThreadID, ca.redditCommentID; -- Order for better readability
+                """, (username,))
+
+                # Fetch all results
+                rows = cur.fetchall()
+
+                # Convert rows to a list of dictionaries for easier use
+                for row in rows:
+                    results.append(dict(row))
 
         except Exception as e:
             print(f"Error retrieving analysis history for user '{username}': {e}")
             # In a real bot, you might log this error more formally
-        finally:
-            if conn:
-                conn.close()
-        return results
\ No newline at end of file
+        return results
+
+    def get_user_stats(self, username):
+        """
+        Returns the number of analyzed comments per argument_type for a user, counted in SQL
+        over the recent rows plus the monthly rollups of the rows removed by retention.
+        """
+        results = {}
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT argument_type, SUM(comments)
+                    FROM (
+                        SELECT argument_type, COUNT(*) AS comments
+                        FROM CommentAnalysis
+                        WHERE author = ?
+                        GROUP BY argument_type
+                        UNION ALL
+                        SELECT argument_type, SUM(comments)
+                        FROM MonthlyCommentStats
+                        WHERE author = ?
+                        GROUP BY argument_type
+                    )
+                    GROUP BY argument_type;
+                """, (username, username))
+                for argument_type, count in cur.fetchall():
+                    results[argument_type] = count
+        except Exception as e:
+            print(f"Error retrieving stats for user '{username}': {e}")
+        return results
+
+    def get_user_recent_analyses(self, username, argument_type, limit):
+        """Returns the most recently stored analyses of one argument_type for a user, newest first."""
+        results = []
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+                # INSERT OR REPLACE assigns a new rowid, so rowid order is storage order
+                cur.execute("""
+                    SELECT
+                        ca.redditCommentID,
+                        ca.fallacy_type,
+                        ac.redditThreadID,
+                        ac.redditCommunity,
+                        ac.overall_argument_type AS context_overall_argument_type
+                    FROM
+                        CommentAnalysis AS ca
+                    JOIN
+                        AnalysisContext AS ac ON ca.analysisCommentID = ac.analysisCommentID
+                    WHERE
+                        ca.author = ? AND ca.argument_type = ?
+                    ORDER BY
+                        ca.rowid DESC
+                    LIMIT ?;
+                """, (username, argument_type, limit))
+                for row in cur.fetchall():
+                    results.append(dict(row))
+        except Exception as e:
+            print(f"Error retrieving recent analyses for user '{username}': {e}")
+        return results
+
+    def get_comment_analyses(self, comment_ids):
+        """Returns the stored CommentAnalysis rows for the given comment IDs, keyed by redditCommentID."""
+        results = {}
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+
+                comment_ids = list(comment_ids)
+                for start in range(0, len(comment_ids), 500):  # Stay below SQLite's bound parameter limit
+                    chunk = comment_ids[start:start + 500]
+                    cur.execute(f"""
+                        SELECT redditCommentID, author, comment_summary, argument_type, fallacy_type, flaw_description
+                        FROM CommentAnalysis
+                        WHERE redditCommentID IN ({', '.join('?' * len(chunk))});
+                    """, chunk)
+                    for row in cur.fetchall():
+                        results[row['redditCommentID']] = dict(row)
+        except Exception as e:
+            print(f"Error retrieving stored comment analyses: {e}")
+        return results
+
+    def iter_query(self, query, params=(), chunk_size=1000):
+        """
+        Runs a read-only query and yields (column names, rows) for every chunk of up to
+        chunk_size rows, so callers can process arbitrarily large results in constant memory.
+        A query matching nothing yields one empty chunk, so the column names are always known.
+        The pooled connection stays borrowed until the generator is exhausted or closed.
+        Errors are raised to the caller, since a silently truncated result would look complete.
+        """
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.arraysize = chunk_size
+            cur.execute(query, params)
+            columns = [column[0] for column in cur.description]
+            rows = cur.fetchmany()
+            yield columns, rows
+            while rows:
+                rows = cur.fetchmany()
+                if rows:
+                    yield columns, rows
+
+    # --- Retention ---
+    def apply_retention(self, max_age, factcheck_max_age=None, batch_size=5000):
+        """
+        Rolls the CommentAnalysis and AnalysisContext rows older than max_age seconds into
+        MonthlyCommentStats and MonthlyAnalysisStats and deletes them, so the detail tables
+        only hold recent analyses. Finished jobs older than max_age and fact-check verdicts
+        older than factcheck_max_age are deleted as well. Returns the number of comment rows
+        rolled up.
+        """
+        cutoff = time.time() - max_age
+        rolled_up = 0
+        try:
+            # Comments first: every comment row is at least as old as the context it belongs to
+            rolled_up = self._roll_up("CommentAnalysis", cutoff, batch_size, """
+                INSERT INTO MonthlyCommentStats (author, redditCommunity, month, argument_type, fallacy_type, comments)
+                SELECT
+                    COALESCE(ca.author, '[Deleted User]'),
+                    COALESCE(ac.redditCommunity, ''),
+                    strftime('%Y-%m', ca.createdAt, 'unixepoch'),
+                    COALESCE(ca.argument_type, ''),
+                    COALESCE(ca.fallacy_type, ''),
+                    COUNT(*)
+                FROM CommentAnalysis AS ca
+                LEFT JOIN AnalysisContext AS ac ON ca.analysisCommentID = ac.analysisCommentID
+                WHERE ca.createdAt < :cutoff AND (:batch_end IS NULL OR ca.createdAt <= :batch_end)
+                GROUP BY 1, 2, 3, 4, 5
+                ON CONFLICT (author, redditCommunity, month, argument_type, fallacy_type)
+                DO UPDATE SET comments = comments + excluded.comments;
+            """)
+            self._roll_up("AnalysisContext", cutoff, batch_size, """
+                INSERT INTO MonthlyAnalysisStats (redditCommunity, month, overall_argument_type, analyses)
+                SELECT redditCommunity, strftime('%Y-%m', createdAt, 'unixepoch'), COALESCE(overall_argument_type, ''), COUNT(*)
+                FROM AnalysisContext
+                WHERE createdAt < :cutoff AND (:batch_end IS NULL OR createdAt <= :batch_end)
+                GROUP BY 1, 2, 3
+                ON CONFLICT (redditCommunity, month, overall_argument_type)
+                DO UPDATE SET analyses = analyses + excluded.analyses;
+            """)
+
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM Jobs WHERE state IN ('replied', 'failed') AND updatedAt < ?;", (cutoff,))
+                jobs_deleted = cur.rowcount
+                verdicts_deleted = 0
+                if factcheck_max_age is not None:
+                    cur.execute("DELETE FROM FactCheckCache WHERE createdAt < ?;", (time.time() - factcheck_max_age,))
+                    verdicts_deleted = cur.rowcount
+                conn.commit()
+            print(f"Retention: rolled up {rolled_up} comment analyses, deleted {jobs_deleted} finished jobs and {verdicts_deleted} expired fact-checks.")
+        except Exception as e:
+            print(f"Error applying retention: {e}")
+        return rolled_up
+
+    def _roll_up(self, table, cutoff, batch_size, rollup_query):
+        """
+        Runs rollup_query, then deletes the same rows from table, for the rows created before
+        cutoff. Each transaction covers about batch_size rows (oldest first), so the write lock
+        is only held briefly. Returns the number of rows deleted.
+        """
+        deleted = 0
+        while True:
+            with metrics.timer("db.retention_batch"), self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE;")
+                # Rows sharing the last timestamp all go into this batch, so every batch makes progress
+                row = cur.execute(f"SELECT createdAt FROM {table} WHERE createdAt < ? ORDER BY createdAt LIMIT 1 OFFSET ?;",
+                                  (cutoff, batch_size - 1)).fetchone()
+                params = {"cutoff": cutoff, "batch_end": row[0] if row else None}
+                cur.execute(rollup_query, params)
+                cur.execute(f"DELETE FROM {table} WHERE createdAt < :cutoff AND (:batch_end IS NULL OR createdAt <= :batch_end);", params)
+                deleted += cur.rowcount
+                conn.commit()
+            if row is None:
+                return deleted
+
+    def compact(self):
+        """
+        Returns the pages freed by deletions to the filesystem (incremental vacuum) and
+        truncates the write-ahead log. Returns the number of pages released.
+        """
+        try:
+            with metrics.timer("db.compact"), self.connection() as conn:
+                cur = conn.cursor()
+                free_pages = cur.execute("PRAGMA freelist_count;").fetchone()[0]
+                cur.execute("PRAGMA incremental_vacuum;").fetchall()  # Frees one page per step, so read it to the end
+                conn.commit()
+                cur.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchall()
+            return free_pages
+        except Exception as e:
+            print(f"Error compacting the database: {e}")
+            return 0
+
+    # --- Durable Job Queue ---
+    def enqueue_job(self, triggerCommentID, command, args, threadID=None):
+        """Records a queued job. Returns False if a job for this trigger comment already exists."""
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                now = time.time()
+                cur.execute("""
+                    INSERT OR IGNORE INTO Jobs (triggerCommentID, command, args, state, createdAt, updatedAt, threadID)
+                    VALUES (?, ?, ?, 'queued', ?, ?, ?);
+                """, (triggerCommentID, command, json.dumps(args), now, now, threadID))
+                conn.commit()
+                return cur.rowcount == 1
+        except Exception as e:
+            print(f"Error enqueuing job for comment '{triggerCommentID}': {e}")
+            # Without a job record the comment is handled anyway rather than dropped
+            return True
+
+    def claim_job(self, triggerCommentID):
+        """Moves a queued job to running. Returns False if it was not queued."""
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    UPDATE Jobs SET state = 'running', attempts = attempts + 1, updatedAt = ?
+                    WHERE triggerCommentID = ? AND state = 'queued';
+                """, (time.time(), triggerCommentID))
+                conn.commit()
+                return cur.rowcount == 1
+        except Exception as e:
+            print(f"Error claiming job for comment '{triggerCommentID}': {e}")
+            return True
+
+    def claim_next_job(self, worker, lease_seconds):
+        """
+        Atomically moves the oldest runnable queued job to running for worker and returns it
+        as a dict (args decoded), or None if there is nothing to do. A job is skipped while
+        another job in the same thread is running, so one thread's mentions run in order.
+        Jobs left running for longer than lease_seconds belonged to a worker that died and
+        are queued again first.
+        """
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+                now = time.time()
+                # Takes the write lock up front so two workers cannot select the same job
+                cur.execute("BEGIN IMMEDIATE;")
+                cur.execute("UPDATE Jobs SET state = 'queued', updatedAt = ? WHERE state = 'running' AND updatedAt < ?;",
+                            (now, now - lease_seconds))
+                if cur.rowcount:
+                    print(f"Requeued {cur.rowcount} jobs whose worker stopped responding.")
+                cur.execute("""
+                    SELECT triggerCommentID, command, args, threadID FROM Jobs AS job
+                    WHERE state = 'queued' AND (threadID IS NULL OR NOT EXISTS (
+                        SELECT 1 FROM Jobs AS running
+                        WHERE running.state = 'running' AND running.threadID = job.threadID
+                    ))
+                    ORDER BY createdAt
+                    LIMIT 1;
+                """)
+                row = cur.fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+                cur.execute("""
+                    UPDATE Jobs SET state = 'running', attempts = attempts + 1, worker = ?, updatedAt = ?
+                    WHERE triggerCommentID = ?;
+                """, (worker, now, row['triggerCommentID']))
+                conn.commit()
+                job = dict(row)
+                job['args'] = json.loads(job['args']) if job['args'] else []
+                return job
+        except Exception as e:
+            print(f"Error claiming the next job for worker '{worker}': {e}")
+            return None
+
+    def renew_job_leases(self, worker):
+        """Marks every job worker is running as still alive, so claim_next_job does not requeue it."""
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("UPDATE Jobs SET updatedAt = ? WHERE state = 'running' AND worker = ?;", (time.time(), worker))
+                conn.commit()
+        except Exception as e:
+            print(f"Error renewing the job leases of worker '{worker}': {e}")
+
+    def complete_job(self, triggerCommentID, replyCommentID):
+        self._update_job(triggerCommentID, "UPDATE Jobs SET state = 'replied', replyCommentID = ?, updatedAt = ? WHERE triggerCommentID = ?;",
+                         (replyCommentID, time.time(), triggerCommentID))
+
+    def fail_job(self, triggerCommentID, error, max_attempts):
+        """Puts a job back in the queue for the next start, or marks it failed after max_attempts."""
+        self._update_job(triggerCommentID, """
+            UPDATE Jobs SET state = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, lastError = ?, updatedAt = ?
+            WHERE triggerCommentID = ?;
+        """, (max_attempts, error, time.time(), triggerCommentID))
+
+    def _update_job(self, triggerCommentID, query, params):
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(query, params)
+                conn.commit()
+        except Exception as e:
+            print(f"Error updating job for comment '{triggerCommentID}': {e}")
+
+    def get_resumable_jobs(self):
+        """
+        Returns the jobs a previous run left queued or running (oldest first). Running jobs
+        were interrupted mid-flight, so they are reset to queued before being returned.
+        """
+        results = []
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+                cur.execute("UPDATE Jobs SET state = 'queued', updatedAt = ? WHERE state = 'running';", (time.time(),))
+                conn.commit()
+                cur.execute("SELECT triggerCommentID, command, args FROM Jobs WHERE state = 'queued' ORDER BY createdAt;")
+                for row in cur.fetchall():
+                    job = dict(row)
+                    job['args'] = json.loads(job['args']) if job['args'] else []
+                    results.append(job)
+        except Exception as e:
+            print(f"Error retrieving resumable jobs: {e}")
+        return results
+
+    # --- LLM Response Cache ---
+    def get_cached_response(self, cacheKey, min_created_at):
+        """Returns the cached response text for a key, or None if missing or older than min_created_at."""
+        result = None
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT response FROM ResponseCache WHERE cacheKey = ? AND createdAt >= ?;",
+                            (cacheKey, min_created_at))
+                row = cur.fetchone()
+                if row:
+                    result = row[0]
+                    cur.execute("UPDATE ResponseCache SET lastAccess = ? WHERE cacheKey = ?;", (time.time(), cacheKey))
+                    conn.commit()
+        except Exception as e:
+            print(f"Error reading cached response '{cacheKey}': {e}")
+        return result
+
+    def store_cached_response(self, cacheKey, fingerprint, response, max_entries, min_created_at):
+        """Stores a response and evicts expired entries and the least recently used ones above max_entries."""
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                now = time.time()
+                cur.execute("""
+                    INSERT OR REPLACE INTO ResponseCache (cacheKey, fingerprint, response, createdAt, lastAccess)
+                    VALUES (?, ?, ?, ?, ?);
+                """, (cacheKey, fingerprint, response, now, now))
+                cur.execute("DELETE FROM ResponseCache WHERE createdAt < ?;", (min_created_at,))
+                cur.execute("""
+                    DELETE FROM ResponseCache WHERE cacheKey IN (
+                        SELECT cacheKey FROM ResponseCache ORDER BY lastAccess DESC LIMIT -1 OFFSET ?
+                    );
+                """, (max_entries,))
+                conn.commit()
+        except Exception as e:
+            print(f"Error storing cached response '{cacheKey}': {e}")
+
+    def invalidate_cached_responses(self, fingerprint=None):
+        """Deletes cached responses written under a different fingerprint, or all of them if none is given."""
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                if fingerprint is None:
+                    cur.execute("DELETE FROM ResponseCache;")
+                else:
+                    cur.execute("DELETE FROM ResponseCache WHERE fingerprint != ?;", (fingerprint,))
+                if cur.rowcount:
+                    print(f"Invalidated {cur.rowcount} cached responses.")
+                conn.commit()
+        except Exception as e:
+            print(f"Error invalidating cached responses: {e}")
+
+    # --- Fact-Check Verdict Cache ---
+    def get_cached_factcheck(self, claimKey, min_created_at):
+        """Returns (result JSON text, createdAt) for a cached verdict, or None if missing or expired."""
+        result = None
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT result, createdAt FROM FactCheckCache WHERE claimKey = ? AND createdAt >= ?;",
+                            (claimKey, min_created_at))
+                row = cur.fetchone()
+                if row:
+                    result = (row[0], row[1])
+        except Exception as e:
+            print(f"Error reading cached fact-check '{claimKey}': {e}")
+        return result
+
+    def store_cached_factcheck(self, claimKey, claim, result):
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT OR REPLACE INTO FactCheckCache (claimKey, claim, result, createdAt)
+                    VALUES (?, ?, ?, ?);
+                """, (claimKey, claim, result, time.time()))
+                conn.commit()
+        except Exception as e:
+            print(f"Error storing cached fact-check '{claimKey}': {e}")
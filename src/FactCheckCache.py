@@ -0,0 +1,61 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+
+from Metrics import metrics
+
+
+class FactCheckCache:
+    """
+    Database-backed cache of fact-check verdicts keyed on the normalized claim.
+
+    Claims and their supporting arguments are normalized (Unicode NFKC, case folded,
+    punctuation dropped, whitespace collapsed) before hashing, so the same claim
+    repeated with different capitalization or punctuation in another thread maps to
+    the same entry. Arguments are compared as a set, independent of their order.
+    Verdicts older than ttl seconds are treated as missing, so they get re-checked.
+    """
+
+    NON_WORD = re.compile(r"[^\w%$€£.]+|(?<!\d)\.|\.(?!\d)")  # Keeps decimals like 3.5 intact
+
+    def __init__(self, db, ttl=3 * 24 * 3600):
+        self.DB = db
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def normalize(cls, text):
+        text = unicodedata.normalize("NFKC", text or "").casefold()
+        return " ".join(cls.NON_WORD.sub(" ", text).split())
+
+    def make_key(self, claim, arguments):
+        normalized_arguments = sorted({self.normalize(argument) for argument in arguments or []} - {""})
+        payload = "\n".join([self.normalize(claim)] + normalized_arguments)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, claim, arguments):
+        """Returns (result, age in seconds) for a cached verdict, or None."""
+        cached = self.DB.get_cached_factcheck(self.make_key(claim, arguments), time.time() - self.ttl)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.increment("cache.factcheck.misses" if cached is None else "cache.factcheck.hits")
+        if cached is None:
+            return None
+
+        result_text, created_at = cached
+        return json.loads(result_text), time.time() - created_at
+
+    def put(self, claim, arguments, result):
+        self.DB.store_cached_factcheck(self.make_key(claim, arguments), claim, json.dumps(result))
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
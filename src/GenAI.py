@@ -1,33 +1,287 @@
 import json
+import os
+import random
+import threading
 import time
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 
+import httpx
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+
+from JSONStream import JSONArrayStreamParser
+from Metrics import metrics
+from ModelRouter import ModelRouter
+from PromptContextCache import PromptContextCache
+from SchemaValidator import Salvage, SchemaValidator
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+FOLLOWUP_INSTRUCTION = (
+    "\n\nThe entries for the comments listed below are still missing. Respond for these comments only, "
+    "using the same format, and leave every other comment out. Comment IDs: "
+)
 
 
 class GenAI:
-    def __init__(self):
+    def __init__(self, cache=None, factcheck_cache=None, client=None):
 
-        self.API = genai.Client()
+        # Upper bound on Gemini requests in flight across the whole process
+        self.max_concurrency = int(os.getenv("GENAI_MAX_CONCURRENCY", "8"))
+        self.timeout = float(os.getenv("GENAI_TIMEOUT", "120"))  # Seconds per request
+        self.max_retries = int(os.getenv("GENAI_MAX_RETRIES", "4"))
+        self.retry_base_delay = float(os.getenv("GENAI_RETRY_BASE_DELAY", "1.0"))  # Seconds
+        self.retry_max_delay = float(os.getenv("GENAI_RETRY_MAX_DELAY", "30.0"))  # Seconds
+        # Requests for the comments whose entries were lost from a truncated or invalid response
+        self.max_followup_requests = int(os.getenv("GENAI_MAX_FOLLOWUP_REQUESTS", "1"))
+
+        self.API = client or genai.Client(http_options=types.HttpOptions(timeout=int(self.timeout * 1000)))
+        self.cache = cache  # Optional ResponseCache shared by all calls
+        self.factcheck_cache = factcheck_cache  # Optional FactCheckCache for per-claim verdicts
+        # Keep the static prompts in the provider's context cache instead of resending them with every request
+        self.prompt_cache = None
+        if os.getenv("PROMPT_CACHE", "1") == "1":
+            self.prompt_cache = PromptContextCache(
+                self.API,
+                ttl=int(os.getenv("PROMPT_CACHE_TTL", "3600")),  # Seconds
+                refresh_margin=int(os.getenv("PROMPT_CACHE_REFRESH_MARGIN", "300")),  # Extend the TTL when less than this is left
+                min_tokens=int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))  # Smallest prompt the model accepts for caching
+            )
+        # Short threads go to a lighter model and very long ones to a larger-context model
+        default_model = os.getenv("GENAI_MODEL", "gemini-2.5-flash")
+        routing = os.getenv("MODEL_ROUTING", "1") == "1"
+        self.router = ModelRouter(
+            {
+                "light": os.getenv("GENAI_MODEL_LIGHT", "gemini-2.5-flash-lite") if routing else default_model,
+                "default": default_model,
+                "large": os.getenv("GENAI_MODEL_LARGE", "gemini-2.5-pro") if routing else default_model,
+            },
+            light_max_tokens=int(os.getenv("MODEL_ROUTER_LIGHT_MAX_TOKENS", "2000")),  # Largest thread sent to the light model
+            large_min_tokens=int(os.getenv("MODEL_ROUTER_LARGE_MIN_TOKENS", "32000")),  # Smallest thread sent to the large model
+            min_tiers={"factcheck_prompt": "default"},  # Grounded verdicts are not worth the light model's savings
+            max_error_rate=float(os.getenv("MODEL_ROUTER_MAX_ERROR_RATE", "0.5")),
+            max_latency=float(os.getenv("MODEL_ROUTER_MAX_LATENCY", "60"))  # Seconds (p90) before a model is avoided
+        )
+        self.limiter = threading.BoundedSemaphore(self.max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="genai")
         with open("prompts/fallacy_prompt.txt", 'r', encoding='utf-8') as f:
             self.fallacyPrompt = f.read()
         with open("prompts/claim_extraction_prompt.txt", 'r', encoding='utf-8') as f:
             self.claimPrompt = f.read()
         with open("prompts/factcheck_prompt.txt", 'r', encoding='utf-8') as f:
             self.factchecking_prompt = f.read()
+        with open("prompts/full_analysis_prompt.txt", 'r', encoding='utf-8') as f:
+            # Built from the two task prompts so the combined call always follows the same instructions
+            self.fullAnalysisPrompt = (
+                f"{f.read()}\n"
+                f"=== Task 1: Argument and fallacy analysis ===\n\n{self.fallacyPrompt}\n\n"
+                f"=== Task 2: Claim extraction ===\n\n{self.claimPrompt}"
+            )
         with open("schemas/fallacy_response_schema.json", 'r', encoding='utf-8') as f:
             self.fallacy_response_schema = json.load(f)
         with open("schemas/claims_response_schema.json", 'r', encoding='utf-8') as f:
             self.claim_response_schema = json.load(f)
         with open("schemas/fact_check_output_schema.json", 'r', encoding='utf-8') as f:
             self.factchecking_schema = json.load(f)
+        self.full_analysis_schema = self.merge_schemas(self.fallacy_response_schema, self.claim_response_schema)
+        self.fallacy_validator = SchemaValidator(self.fallacy_response_schema)
+        self.claim_validator = SchemaValidator(self.claim_response_schema)
+        self.factchecking_validator = SchemaValidator(self.factchecking_schema)
+        self.full_analysis_validator = SchemaValidator(self.full_analysis_schema)
 
         self.groundingTool = types.Tool(
             google_search=types.GoogleSearch()
         )
 
-    def extract_claims_from_thread(self, comment_thread_text):
+    @staticmethod
+    def merge_schemas(*schemas):
+        """Combines object schemas into one object schema with all of their properties and required fields."""
+        merged = {"type": "object", "properties": {}, "required": []}
+        for schema in schemas:
+            for name, subschema in schema.get("properties", {}).items():
+                if name in merged["properties"] and merged["properties"][name] != subschema:
+                    raise ValueError(f"Schemas define property '{name}' differently and cannot be merged.")
+                merged["properties"][name] = subschema
+            merged["required"].extend(name for name in schema.get("required", []) if name not in merged["required"])
+        return merged
+
+    def generate_json(self, prompt_name, prompt, content, schema, model=None, usable=None, use_cache=True):
+        """
+        Sends a static prompt plus request content to the model with structured output
+        and returns the raw response text. The model is picked by the router unless one is
+        given; a response that is not usable (by default: not valid JSON) is requested again
+        from the next larger model. Unless use_cache is False, usable responses are stored
+        in the response cache, and later identical requests are answered from it.
+        """
+        usable = usable or self.is_json
+        model = model or self.router.choose(prompt_name, content)
+        cache_key = None
+        if self.cache and use_cache:
+            cache_key = self.cache.make_key(model, prompt_name, prompt, schema, content)
+            cached_text = self.cache.get(cache_key)
+            if cached_text is not None:
+                print(f"Serving '{prompt_name}' response from cache.")
+                return cached_text
+
+        def request(model):
+            """Returns (response, whether its text is usable)."""
+            contents, config = self.prepare_request(model, prompt_name, prompt, content, schema)
+            with self.router.track(model) as outcome:
+                try:
+                    response = self.API.models.generate_content(model=model, contents=contents, config=config)
+                except errors.APIError as e:
+                    if not (config.get("cached_content") and self.prompt_cache.is_cache_error(e)):
+                        raise
+                    # The cached prompt expired or was deleted on the provider side; rebuild the request once
+                    self.prompt_cache.invalidate(config["cached_content"])
+                    contents, config = self.prepare_request(model, prompt_name, prompt, content, schema)
+                    response = self.API.models.generate_content(model=model, contents=contents, config=config)
+                # An unusable response counts against the model's health like a failed request
+                outcome.succeeded = usable(response.text)
+                return response, outcome.succeeded
+
+        while True:
+            response, response_usable = self.call_with_retries(lambda: request(model), prompt_name)
+            self.record_usage(prompt_name, response)
+            if response_usable:
+                break
+            larger = self.router.escalate(model)
+            if larger is None:
+                break
+            print(f"'{prompt_name}' response from {model} was not usable, retrying with {larger}.")
+            model = larger
+
+        if cache_key and response_usable:  # Never cache a response that cannot be used
+            self.cache.put(cache_key, response.text)
+        return response.text
+
+    @staticmethod
+    def is_json(text):
+        try:
+            json.loads(text or "")
+            return True
+        except json.JSONDecodeError:
+            return False
+
+    def generate_validated(self, prompt_name, prompt, content, schema, validator, array_keys, comment_ids=None, use_cache=True):
+        """
+        Requests structured output and returns the valid part of it as a dict that always
+        contains array_keys; required top-level fields may be missing if they were lost.
+        Invalid entries are dropped and the complete entries of a truncated response are
+        kept. When comment_ids (the comments in the thread, oldest first) are given, the
+        comments whose entries were lost are requested again on their own instead of
+        repeating the whole request. use_cache is passed on to generate_json.
+        """
+        salvages = {}  # Response text -> Salvage, so each response is only checked once
+
+        def usable(text):
+            salvaged = salvages[text] = validator.salvage(text, array_keys)
+            return salvaged.complete or any(salvaged.document[key] for key in array_keys)
+
+        def request(request_content):
+            response_text = self.generate_json(prompt_name, prompt, request_content, schema, usable=usable, use_cache=use_cache)
+            return salvages.pop(response_text, None) or validator.salvage(response_text, array_keys)
+
+        salvaged = request(content)
+        document = salvaged.document
+        for _ in range(self.max_followup_requests):
+            if salvaged.complete:
+                break
+            missing = {key: self.missing_comment_ids(salvaged, key, comment_ids) for key in array_keys}
+            requested = [comment_id for comment_id in comment_ids or [] if any(comment_id in ids for ids in missing.values())]
+            if not requested:
+                break
+            print(f"Response to '{prompt_name}' was incomplete, requesting {len(requested)} missing comments again.")
+            metrics.increment(f"gemini.{prompt_name}.followups")
+            salvaged = request(content + FOLLOWUP_INSTRUCTION + ", ".join(requested))
+            for key in array_keys:
+                document[key].extend(entry for entry in salvaged.document[key] if entry.get('comment_id') in missing[key])
+            for name, value in salvaged.document.items():
+                document.setdefault(name, value)
+            comment_ids = requested
+        return document
+
+    @staticmethod
+    def missing_comment_ids(salvaged, array_key, comment_ids):
+        """
+        Returns the IDs from comment_ids whose entries were lost from array_key: dropped as
+        invalid, or after the last recovered entry of an array that was cut off. Comments
+        the model left out of a complete response are not counted as missing.
+        """
+        if not comment_ids:
+            return []
+        covered = {entry.get('comment_id') for entry in salvaged.document[array_key]}
+        missing = {entry.get('comment_id') for entry in salvaged.dropped.get(array_key, []) if isinstance(entry, dict)} - covered
+        if array_key in salvaged.cut_off:
+            positions = [index for index, comment_id in enumerate(comment_ids) if comment_id in covered]
+            missing.update(comment_ids[max(positions) + 1 if positions else 0:])
+        return [comment_id for comment_id in comment_ids if comment_id in missing]
+
+    def prepare_request(self, model, prompt_name, prompt, content, schema):
+        """
+        Returns (contents, config) for a structured-output request. When the prompt is held in
+        the provider's context cache it is referenced instead of being sent with the request.
+        """
+        config = {
+            "temperature": 0.0,
+            "response_mime_type": "application/json",  # Request JSON output
+            "response_schema": schema,  # Provide the defined schema
+            # safety_settings=... # Optionally add safety settings if needed
+        }
+        cached_content = self.prompt_cache.get(model, prompt_name, prompt) if self.prompt_cache else None
+        if cached_content:
+            config["cached_content"] = cached_content
+            return [content], config
+        return [prompt, content], config
+
+    def record_usage(self, prompt_name, response):
+        """Counts the input, cached and output tokens reported for a response."""
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return
+        metrics.increment(f"tokens.{prompt_name}.input", usage.prompt_token_count or 0)
+        metrics.increment(f"tokens.{prompt_name}.cached", usage.cached_content_token_count or 0)
+        metrics.increment(f"tokens.{prompt_name}.output", usage.candidates_token_count or 0)
+
+    def call_with_retries(self, request, description="request"):
+        """
+        Runs a Gemini request under the shared concurrency limiter. Rate limits (429),
+        server errors (5xx) and timeouts are retried with exponential backoff and full
+        jitter; the slot is released while waiting so other requests can proceed.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.limiter, metrics.timer(f"gemini.{description}"):
+                    return request()
+            except (errors.APIError, httpx.TimeoutException) as e:
+                if not self.is_retryable(e) or attempt == self.max_retries:
+                    metrics.increment("gemini.errors")
+                    raise
+                self.wait_before_retry(e, attempt, description)
+
+    def is_retryable(self, error):
+        if isinstance(error, errors.APIError):
+            return error.code in RETRYABLE_STATUS_CODES
+        return isinstance(error, httpx.TimeoutException)
+
+    def wait_before_retry(self, error, attempt, description):
+        """Sleeps for an exponentially growing, fully jittered delay."""
+        reason = f"status {error.code}" if isinstance(error, errors.APIError) else "timeout"
+        metrics.increment("gemini.retries")
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+        print(f"Gemini {description} failed ({reason}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+        time.sleep(delay)
+
+    def close(self):
+        """Releases the provider-side prompt caches."""
+        if self.prompt_cache:
+            self.prompt_cache.close()
+
+    def factcheck_deadline(self):
+        """Latest time (time.monotonic) by which a fact-check submitted now will have finished or failed."""
+        return time.monotonic() + self.timeout * (self.max_retries + 1) + self.retry_max_delay * self.max_retries
+
+    def extract_claims_from_thread(self, comment_thread_text, comment_ids=None):
         if not comment_thread_text.strip():
             # Return default structure if no text to analyze
             return {
@@ -35,90 +289,170 @@ class GenAI:
             }
 
         try:
-            # Construct the prompt for the Gemini model
-
-            prompt_parts = [
+            # Call the Gemini model with structured output configuration; only the valid claims are kept
+            return self.generate_validated(
+                "claim_extraction_prompt",
                 self.claimPrompt,
-                f"Reddit Comment Thread for Analysis:\n\n{comment_thread_text}"
-            ]
-
-            # Call the Gemini model with structured output configuration
-            response = self.API.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt_parts,
-                config={
-                    "temperature": 0.0,
-                    "response_mime_type": "application/json",  # Request JSON output
-                    "response_schema": self.claim_response_schema,  # Provide the defined schema
-                },
-                # safety_settings=... # Optionally add safety settings if needed
+                f"Reddit Comment Thread for Analysis:\n\n{comment_thread_text}",
+                self.claim_response_schema,
+                self.claim_validator,
+                ("claim_entries",),
+                comment_ids
             )
 
-            # Gemini's structured output response.text returns a string, so parse it
-            try:
-                parsed_response = json.loads(response.text)
-                return parsed_response
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from Gemini API: {e}")
-                print(f"Raw Gemini response text: {response.text}")
-                return {
-                    "claim_entries": [],
-                }
-
         except Exception as e:
             print(f"An unexpected error occurred during Gemini API call: {e}")
             return {
                 "claim_entries": [],
             }
 
-    def factcheckClaims(self, claims):
-        if not claims or not claims.get('claim_entries'):
-            return []
+    def stream_claims_from_thread(self, comment_thread_text, model=None, comment_ids=None):
+        """
+        Yields claim entries one at a time from a streamed claim extraction response,
+        each as soon as its JSON object is complete and valid. A request that fails before
+        any claim was yielded is retried like any other call. If the stream breaks off after
+        that, or entries were invalid, the claims of the comments that were lost (see
+        missing_comment_ids) are requested again without streaming and yielded at the end.
+        """
+        if not comment_thread_text.strip():
+            return
 
-        threads = []
-        responses = []
-
-        for entry in claims['claim_entries']:
-            username = entry.get('username', 'N/A')
-            comment_id = entry.get('comment_id', 'N/A')
-            claim = entry.get('claim', '')
-            arguments = entry.get('arguments_entries', [])
-
-            if not claim:
-                continue  # Skip if claim is empty or invalid
-
-            # Construct the factual query for the grounded model
-            # Emphasize factual verification, neutrality, and source citation.
-            # Ensure the prompt is clear that it needs to *use* the search tool.
-            fact_check_query_text = (
-                f"{self.factchecking_prompt}\n\n"+
-                f"Claim to fact-check: {claim}\n"+
-                f"Supporting arguments: {'; '.join(arguments) if arguments else 'None provided.'}\n\n"
-            )
+        content = f"Reddit Comment Thread for Analysis:\n\n{comment_thread_text}"
+        model = model or self.router.choose("claim_extraction_prompt", content)
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(model, "claim_extraction_prompt", self.claimPrompt, self.claim_response_schema, content)
+            cached_text = self.cache.get(cache_key)
+            if cached_text is not None:
+                print("Serving 'claim_extraction_prompt' response from cache.")
+                yield from json.loads(cached_text).get('claim_entries', [])
+                return
+
+        for attempt in range(self.max_retries + 1):
+            parser = JSONArrayStreamParser("claim_entries")
+            chunks = []
+            last_chunk = None
+            yielded = []
+            dropped = []
+            config = {}
+            try:
+                with self.limiter, metrics.timer("gemini.claim_extraction_prompt.stream"), self.router.track(model):
+                    contents, config = self.prepare_request(model, "claim_extraction_prompt", self.claimPrompt, content, self.claim_response_schema)
+                    for chunk in self.API.models.generate_content_stream(model=model, contents=contents, config=config):
+                        if getattr(chunk, "usage_metadata", None):
+                            last_chunk = chunk  # Usage is reported with the final chunks of a stream
+                        if not chunk.text:
+                            continue
+                        chunks.append(chunk.text)
+                        for entry in parser.feed(chunk.text):
+                            entry_errors = self.claim_validator.validate_entry("claim_entries", entry)
+                            if entry_errors:
+                                print(f"Dropping invalid streamed claim: {entry_errors[0]}")
+                                dropped.append(entry)
+                                continue
+                            yielded.append(entry)
+                            yield entry
+                self.record_usage("claim_extraction_prompt", last_chunk)
+                break
+            except (errors.APIError, httpx.TimeoutException) as e:
+                if not yielded and config.get("cached_content") and self.prompt_cache.is_cache_error(e) and attempt < self.max_retries:
+                    self.prompt_cache.invalidate(config["cached_content"])  # The next attempt rebuilds the request
+                    continue
+                if yielded or not self.is_retryable(e) or attempt == self.max_retries:
+                    metrics.increment("gemini.errors")
+                    print(f"Streaming claim extraction failed after {len(yielded)} claims: {e}")
+                    break
+                self.wait_before_retry(e, attempt, "claim_extraction_prompt stream")
+            except Exception as e:
+                print(f"An unexpected error occurred during streamed Gemini API call: {e}")
+                return
 
-            def sendGroundingPrompts():
-                response = self.API.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=fact_check_query_text,
-                    config={
-                        "temperature": 0.0,
-                        "response_mime_type": "application/json",  # Request JSON output
-                        "response_schema": self.factchecking_schema,  # Provide the defined schema
-                    },
-                    # safety_settings=... # Optionally add safety settings if needed
-                )
-                responses.append(response)
-
-            t = Thread(target=sendGroundingPrompts)
-            threads.append(t)
-            t.start()
-
-        for t in threads:
-            t.join()
-
-        return responses
-
-    def analyze_comment_thread_for_flaws(self, comment_thread_text):
+        if cache_key and parser.finished and not dropped:
+            response_text = "".join(chunks)
+            if self.is_json(response_text):  # Never cache a response that cannot be used
+                self.cache.put(cache_key, response_text)
+
+        # Nothing recovered means a follow-up would repeat the whole request
+        if not yielded or not self.max_followup_requests:
+            return
+        salvaged = Salvage({"claim_entries": yielded}, False, set() if parser.finished else {"claim_entries"}, {"claim_entries": dropped})
+        missing = self.missing_comment_ids(salvaged, "claim_entries", comment_ids)
+        if not missing:
+            return
+        print(f"Streamed claim extraction was incomplete, requesting {len(missing)} missing comments again.")
+        metrics.increment("gemini.claim_extraction_prompt.followups")
+        try:
+            followup = self.generate_validated(
+                "claim_extraction_prompt", self.claimPrompt, content + FOLLOWUP_INSTRUCTION + ", ".join(missing),
+                self.claim_response_schema, self.claim_validator, ("claim_entries",))
+        except Exception as e:
+            print(f"Requesting the missing claims failed: {e}")
+            return
+        yield from (entry for entry in followup["claim_entries"] if entry.get('comment_id') in missing)
+
+    def factcheck_claim(self, claim, arguments):
+        """
+        Fact-checks a single claim and its supporting arguments. Cached verdicts are
+        returned with a cache_age_seconds field instead of calling the model.
+        """
+        if self.factcheck_cache:
+            cached = self.factcheck_cache.get(claim, arguments)
+            if cached:
+                result, age = cached
+                print(f"Serving cached fact-check for claim '{claim}' ({age:.0f}s old).")
+                return dict(result, cache_age_seconds=age)
+
+        # Construct the factual query for the grounded model
+        # Emphasize factual verification, neutrality, and source citation.
+        # Ensure the prompt is clear that it needs to *use* the search tool.
+        fact_check_query_text = (
+            f"Claim to fact-check: {claim}\n"+
+            f"Supporting arguments: {'; '.join(arguments) if arguments else 'None provided.'}\n\n"
+        )
+
+        # Verdicts are only cached in the fact-check cache, whose TTL and age note must stay accurate;
+        # the response cache would keep serving a verdict after FACTCHECK_CACHE_TTL expired it
+        result = self.generate_validated(
+            "factcheck_prompt",
+            self.factchecking_prompt,
+            fact_check_query_text,
+            self.factchecking_schema,
+            self.factchecking_validator,
+            ("fact_check_results",),
+            use_cache=False
+        )
+        if not result["fact_check_results"]:
+            raise ValueError("The fact-check response contained no valid result.")
+        if self.factcheck_cache:
+            self.factcheck_cache.put(claim, arguments, result)
+        return result
+
+    @staticmethod
+    def complete_analysis(analysis):
+        """
+        Fills in the overall fields of an analysis whose response was only partly usable,
+        deriving the overall type from the entries that were recovered.
+        """
+        if "overall_summary" in analysis and "overall_argument_type" in analysis:
+            return analysis
+        entries = analysis["analysis_entries"]
+        print(f"Analysis response was incomplete; keeping {len(entries)} recovered entries.")
+        argument_types = {entry["argument_type"] for entry in entries} - {"no_argument_found"}
+        if not argument_types:
+            overall_argument_type = "no_arguments_found"
+        elif argument_types == {"valid_argument"}:
+            overall_argument_type = "valid_discussion"
+        elif argument_types == {"fallacy"}:
+            overall_argument_type = "fallacious_discussion"
+        else:
+            overall_argument_type = "mixed_discussion"
+        return dict({
+            "overall_summary": "Only part of the AI response could be used, so there is no overall summary." if entries
+            else "Error parsing AI response. Please try again.",
+            "overall_argument_type": overall_argument_type,
+        }, **analysis)
+
+    def analyze_comment_thread_for_flaws(self, comment_thread_text, comment_ids=None):
         if not comment_thread_text.strip():
             # Return default structure if no text to analyze
             return {
@@ -128,36 +462,17 @@ class GenAI:
             }
 
         try:
-            # Construct the prompt for the Gemini model
-            prompt_parts = [
+            # Call the Gemini model with structured output configuration; only the valid entries are kept
+            analysis = self.generate_validated(
+                "fallacy_prompt",
                 self.fallacyPrompt,
-                f"Reddit Comment Thread for Analysis:\n\n{comment_thread_text}"
-            ]
-
-            # Call the Gemini model with structured output configuration
-            response = self.API.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt_parts,
-                config={
-                    "temperature": 0.0,
-                    "response_mime_type": "application/json",  # Request JSON output
-                    "response_schema": self.fallacy_response_schema,  # Provide the defined schema
-                },
-                # safety_settings=... # Optionally add safety settings if needed
+                f"Reddit Comment Thread for Analysis:\n\n{comment_thread_text}",
+                self.fallacy_response_schema,
+                self.fallacy_validator,
+                ("analysis_entries",),
+                comment_ids
             )
-
-            # Gemini's structured output response.text returns a string, so parse it
-            try:
-                parsed_response = json.loads(response.text)
-                return parsed_response
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from Gemini API: {e}")
-                print(f"Raw Gemini response text: {response.text}")
-                return {
-                    "analysis_entries": [],
-                    "overall_summary": "Error parsing AI response. Please try again.",
-                    "overall_argument_type": "no_arguments_found"
-                }
+            return self.complete_analysis(analysis)
 
         except Exception as e:
             print(f"An unexpected error occurred during Gemini API call: {e}")
@@ -166,3 +481,38 @@ class GenAI:
                 "overall_summary": "An unexpected error occurred during analysis.",
                 "overall_argument_type": "no_arguments_found"
             }
+
+    def analyze_thread_and_extract_claims(self, comment_thread_text, comment_ids=None):
+        """
+        Runs the fallacy analysis and the claim extraction in one request under the merged
+        schema, so the thread is sent once. Returns a dict with analysis_entries,
+        overall_summary, overall_argument_type and claim_entries.
+        """
+        if not comment_thread_text.strip():
+            return {
+                "analysis_entries": [],
+                "overall_summary": "No relevant comments found in the discussion thread to analyze.",
+                "overall_argument_type": "no_arguments_found",
+                "claim_entries": [],
+            }
+
+        try:
+            analysis = self.generate_validated(
+                "full_analysis_prompt",
+                self.fullAnalysisPrompt,
+                f"Reddit Comment Thread for Analysis:\n\n{comment_thread_text}",
+                self.full_analysis_schema,
+                self.full_analysis_validator,
+                ("analysis_entries", "claim_entries"),
+                comment_ids
+            )
+            return self.complete_analysis(analysis)
+
+        except Exception as e:
+            print(f"An unexpected error occurred during Gemini API call: {e}")
+            return {
+                "analysis_entries": [],
+                "overall_summary": "An unexpected error occurred during analysis.",
+                "overall_argument_type": "no_arguments_found",
+                "claim_entries": [],
+            }
@@ -0,0 +1,80 @@
+import json
+import re
+
+
+class JSONArrayStreamParser:
+    """
+    Incrementally extracts the objects of one top-level array from JSON text that
+    arrives in chunks, e.g. {"claim_entries": [{...}, {...}, ...]}.
+
+    feed() returns every array element that became complete with the new chunk, so
+    callers can act on each entry before the rest of the response has arrived. The
+    same parser recovers all complete entries from a truncated response: feed it the
+    whole text and whatever was finished before the cut-off is returned.
+    """
+
+    def __init__(self, array_key):
+        self.key_pattern = re.compile(r'"' + re.escape(array_key) + r'"\s*:\s*\[')
+        self.buffer = ""
+        self.position = 0  # Next character of buffer to scan
+        self.in_array = False
+        self.finished = False
+        self.object_start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk):
+        """Adds a chunk of text and returns the array elements completed by it."""
+        if self.finished:
+            return []
+        self.buffer += chunk
+        completed = []
+
+        if not self.in_array:
+            match = self.key_pattern.search(self.buffer)
+            if not match:
+                return completed
+            self.in_array = True
+            self.position = match.end()
+
+        buffer = self.buffer
+        i = self.position
+        while i < len(buffer):
+            char = buffer[i]
+            if self.object_start is None:
+                if char == '{':
+                    self.object_start = i
+                    self.depth = 1
+                elif char == ']':
+                    self.finished = True
+                    i += 1
+                    break
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        completed.append(json.loads(buffer[self.object_start:i + 1]))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed array entry in streamed JSON: {e}")
+                    self.object_start = None
+            i += 1
+
+        # Drop everything that was fully consumed so the buffer only holds the open entry
+        keep_from = self.object_start if self.object_start is not None else i
+        self.buffer = buffer[keep_from:]
+        if self.object_start is not None:
+            self.object_start = 0
+        self.position = i - keep_from
+        return completed
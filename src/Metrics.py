@@ -0,0 +1,176 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the latency buckets in seconds; the last bucket catches everything slower
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with approximate percentiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction):
+        """Interpolates the value below which the given fraction of observations fall."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                value = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(max(value, self.min), self.max)
+            seen += bucket_count
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets + ["+Inf"], self.counts)},
+        }
+
+
+class Metrics:
+    """
+    Process-wide registry of per-stage latency histograms and counters.
+
+    Stages are timed with `with metrics.timer("stage"):` and counters are bumped
+    with metrics.increment("name"). Gauges (e.g. queue depths) are read from a
+    callback registered with metrics.register_gauge() whenever a snapshot is taken. The current values can be written to a JSON
+    file periodically and/or served as JSON from a local HTTP endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started_at = time.time()
+        self._server = None
+        self._reporter = None
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register_gauge(self, name, callback):
+        with self._lock:
+            self.gauges[name] = callback
+
+    @contextmanager
+    def timer(self, stage):
+        """Times the block and records it under stage; failures are also counted as stage.errors."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(f"{stage}.errors")
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            gauges = dict(self.gauges)
+        gauge_values = {}
+        for name, callback in sorted(gauges.items()):
+            try:
+                gauge_values[name] = callback()
+            except Exception as e:
+                print(f"Error reading gauge '{name}': {e}")
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "uptime_seconds": time.time() - self.started_at,
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": gauge_values,
+                "latency_seconds": {stage: histogram.snapshot() for stage, histogram in sorted(self.histograms.items())},
+            }
+
+    def dump_json(self, path):
+        """Writes the current snapshot to path atomically."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temp_path, path)
+
+    def start_reporting(self, dump_path=None, interval=60, port=None):
+        """Starts the periodic JSON dump and/or the local metrics endpoint, if configured."""
+        if dump_path and not self._reporter:
+            def report():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.dump_json(dump_path)
+                    except Exception as e:
+                        print(f"Error writing metrics to '{dump_path}': {e}")
+
+            self._reporter = threading.Thread(target=report, name="metrics-reporter", daemon=True)
+            self._reporter.start()
+            print(f"Writing metrics to {dump_path} every {interval}s")
+
+        if port and not self._server:
+            registry = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.rstrip('/') not in ("", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = json.dumps(registry.snapshot(), indent=2).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass  # Keep scrapes out of the bot's output
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+            threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+
+    def stop_reporting(self, dump_path=None):
+        if self._server:
+            self._server.shutdown()
+            self._server = None
+        if dump_path:
+            self.dump_json(dump_path)
+
+
+metrics = Metrics()
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from Metrics import metrics
+
+TIERS = ("light", "default", "large")
+
+
+class ModelRouter:
+    """
+    Picks the model tier for each Gemini request.
+
+    Requests are routed by the estimated size of the request content: up to
+    light_max_tokens go to the light model, from large_min_tokens on to the large
+    (long-context) model, and everything in between to the default model. Tasks listed
+    in min_tiers never go below the given tier (e.g. fact-checks stay off the light
+    model). The last window outcomes of every model within max_age seconds are kept; a
+    model whose error rate or p90 latency is above its limit is skipped in favour of the
+    next larger tier, or the next smaller one if there is none. Since outcomes age out,
+    a skipped model is tried again after max_age seconds. When a response cannot be used (e.g. it
+    is not valid JSON), escalate() gives the next larger model to retry with.
+    """
+
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, models, light_max_tokens=2000, large_min_tokens=32000, min_tiers=None,
+                 window=20, max_age=300, max_error_rate=0.5, max_latency=60.0):
+        self.models = models  # tier -> model name
+        self.light_max_tokens = light_max_tokens
+        self.large_min_tokens = large_min_tokens
+        self.min_tiers = min_tiers or {}  # prompt name -> lowest tier it may use
+        self.window = window
+        self.max_age = max_age  # Seconds an outcome counts towards a model's health
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency  # Seconds
+
+        self._lock = threading.Lock()
+        self._outcomes = {}  # model -> deque of (recorded at, seconds, succeeded)
+
+    def tier_for(self, prompt_name, content):
+        """Returns the tier matching the size of the request content and the task's minimum tier."""
+        tokens = len(content) / self.CHARS_PER_TOKEN
+        if tokens >= self.large_min_tokens:
+            tier = "large"
+        elif tokens <= self.light_max_tokens:
+            tier = "light"
+        else:
+            tier = "default"
+        minimum = self.min_tiers.get(prompt_name, "light")
+        return TIERS[max(TIERS.index(tier), TIERS.index(minimum))]
+
+    def choose(self, prompt_name, content):
+        """Returns the model to send the request to."""
+        tier = self.tier_for(prompt_name, content)
+        routed = self.models[tier]
+        index = TIERS.index(tier)
+        # Prefer moving up a tier when the routed model is struggling; only move down when nothing above is healthy
+        for candidate in TIERS[index:] + TIERS[:index][::-1]:
+            model = self.models[candidate]
+            if self.is_healthy(model):
+                if model != routed:
+                    print(f"Model {routed} is degraded, routing '{prompt_name}' to {model} instead.")
+                    metrics.increment("model_router.rerouted")
+                break
+        else:
+            candidate, model = tier, routed  # Nothing is healthy; stay with the routed model
+        metrics.increment(f"model_router.{prompt_name}.{candidate}")
+        return model
+
+    def escalate(self, model):
+        """Returns the next larger model after model, or None if it is already the largest."""
+        tiers = [tier for tier in TIERS if self.models[tier] == model]
+        if not tiers:
+            return None
+        for tier in TIERS[TIERS.index(tiers[-1]) + 1:]:
+            if self.models[tier] != model:
+                metrics.increment("model_router.escalations")
+                return self.models[tier]
+        return None
+
+    @contextmanager
+    def track(self, model):
+        """
+        Records the latency and success of the request run in the block against model.
+        The block gets an outcome whose succeeded it can set to False when the response
+        turns out to be unusable, so that counts as a single failure.
+        """
+        start = time.perf_counter()
+        outcome = SimpleNamespace(succeeded=True)
+        try:
+            yield outcome
+        except Exception:
+            self.record(model, time.perf_counter() - start, False)
+            raise
+        self.record(model, time.perf_counter() - start, outcome.succeeded)
+
+    def record(self, model, seconds, succeeded):
+        """Adds an outcome for model; seconds may be None for failures without a meaningful latency."""
+        with self._lock:
+            outcomes = self._outcomes.get(model)
+            if outcomes is None:
+                outcomes = self._outcomes[model] = deque(maxlen=self.window)
+            outcomes.append((time.time(), seconds, succeeded))
+
+    def is_healthy(self, model):
+        with self._lock:
+            cutoff = time.time() - self.max_age
+            outcomes = [(seconds, succeeded) for recorded_at, seconds, succeeded in self._outcomes.get(model, ()) if recorded_at >= cutoff]
+        if len(outcomes) < self.window // 2:
+            return True  # Too few recent requests to judge
+        errors = sum(1 for _, succeeded in outcomes if not succeeded)
+        if errors / len(outcomes) > self.max_error_rate:
+            return False
+        latencies = sorted(seconds for seconds, _ in outcomes if seconds is not None)
+        return not latencies or latencies[int(0.9 * (len(latencies) - 1))] <= self.max_latency
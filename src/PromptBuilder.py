@@ -0,0 +1,164 @@
+import math
+from collections import namedtuple
+
+# comment_ids lists the comments included for analysis (not summarized or omitted), oldest first
+ThreadPrompt = namedtuple("ThreadPrompt", ["text", "tokens_used", "tokens_dropped", "comments_dropped", "comment_ids"])
+
+
+class ThreadPromptBuilder:
+    """
+    Builds the thread text sent to Gemini within a token budget.
+
+    The original post is always included, with its body truncated to at most
+    max_post_tokens. Comments are added from the one nearest the trigger comment
+    backwards until the budget is used up, so the part of the discussion the user
+    replied to is kept and the oldest comments are dropped first. Quoted lines
+    ("> ...") that repeat text from earlier in the thread are removed, and single
+    comments longer than max_comment_tokens are truncated with a marker.
+
+    Tokens are estimated at CHARS_PER_TOKEN characters per token, which is close
+    enough for budgeting without a tokenizer round-trip.
+    """
+
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, max_post_tokens=4000, max_comment_tokens=2000):
+        self.max_post_tokens = max_post_tokens
+        self.max_comment_tokens = max_comment_tokens
+
+    def estimate_tokens(self, text):
+        return math.ceil(len(text) / self.CHARS_PER_TOKEN)
+
+    def truncate(self, text, max_tokens):
+        """Cuts text down to about max_tokens at a word boundary and marks the cut."""
+        max_chars = max_tokens * self.CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        cut = text.rfind(" ", 0, max_chars)
+        if cut < max_chars // 2:
+            cut = max_chars
+        return f"{text[:cut]} [... {len(text) - cut} characters truncated]"
+
+    @staticmethod
+    def _normalize(text):
+        return " ".join(text.split()).lower()
+
+    def trim_repeated_quotes(self, body, earlier_text):
+        """Replaces runs of quoted lines whose text already appears in earlier_text (normalized)."""
+        lines = body.split("\n")
+        result = []
+        quote_run = []
+
+        def flush():
+            quoted = self._normalize(" ".join(line.lstrip("> ").strip() for line in quote_run))
+            if quoted and quoted in earlier_text:
+                result.append("> [quote of an earlier comment removed]")
+            else:
+                result.extend(quote_run)
+            quote_run.clear()
+
+        for line in lines:
+            if line.lstrip().startswith(">"):
+                quote_run.append(line)
+                continue
+            if quote_run:
+                flush()
+            result.append(line)
+        if quote_run:
+            flush()
+        return "\n".join(result)
+
+    def build(self, original_post, ancestor_comments, token_budget, prior_analyses=None):
+        """
+        Returns a ThreadPrompt for the post and its ancestor comments (oldest first).
+        Comments with an entry in prior_analyses are rendered as compact summaries.
+        """
+        prior_analyses = prior_analyses or {}
+        tokens_dropped = 0
+
+        post_block = ""
+        earlier_texts = []
+        if original_post:
+            post_block = self.render_post(original_post, self.max_post_tokens)
+            if original_post.selftext:
+                earlier_texts.append(self._normalize(original_post.selftext))
+                tokens_dropped += self.estimate_tokens(self.render_post(original_post, None)) - self.estimate_tokens(post_block)
+
+        # Render comment blocks in thread order so quotes can be checked against everything before them
+        comment_blocks = []
+        analyzed_ids = []  # Per block: the comment ID if the comment is sent in full, else None
+        for comment_ancestor in ancestor_comments or []:
+            author_name = comment_ancestor.author.name if comment_ancestor.author else '[Deleted User]'
+            prior = prior_analyses.get(comment_ancestor.id)
+            if prior:
+                fallacy_str = f" - {prior['fallacy_type']}" if prior['fallacy_type'] else ""
+                text = f"[Previously analyzed] {prior['comment_summary']} (Type: {prior['argument_type']}{fallacy_str})"
+                analyzed_ids.append(None)
+            else:
+                text = self.trim_repeated_quotes(comment_ancestor.body, " ".join(earlier_texts))
+                text = self.truncate(text, self.max_comment_tokens)
+                tokens_dropped += self.estimate_tokens(comment_ancestor.body) - self.estimate_tokens(text)
+                analyzed_ids.append(comment_ancestor.id)
+            earlier_texts.append(self._normalize(comment_ancestor.body))
+            comment_blocks.append(f"Comment ID: {comment_ancestor.id}\nUser ({author_name}): {text}\n---\n")
+
+        header = ""
+        if comment_blocks:
+            header = "--- Comment Thread --- (Oldest to Newest, excluding trigger comment)\n"
+            if prior_analyses:
+                header += "Comments marked [Previously analyzed] were analyzed before and are only shown as a summary for context. Do not include them in analysis_entries.\n"
+
+        # The post is always kept; if it alone exceeds the budget its body is cut further
+        remaining = token_budget - self.estimate_tokens(post_block) - self.estimate_tokens(header) - 1
+        if remaining < 0 and original_post and original_post.selftext:
+            frame_tokens = self.estimate_tokens(self.render_post(original_post, 0))
+            shortened = self.render_post(original_post, max(0, remaining + self.estimate_tokens(post_block) - frame_tokens))
+            tokens_dropped += self.estimate_tokens(post_block) - self.estimate_tokens(shortened)
+            post_block = shortened
+            remaining = token_budget - self.estimate_tokens(post_block) - self.estimate_tokens(header) - 1
+
+        kept_blocks = self.pack(comment_blocks, remaining)
+        if len(kept_blocks) < len(comment_blocks):
+            # Repack with room for the omission note, sized for the largest possible count
+            kept_blocks = self.pack(comment_blocks, remaining - self.estimate_tokens(self.omission_note(len(comment_blocks))))
+
+        comments_dropped = len(comment_blocks) - len(kept_blocks)
+        tokens_dropped += sum(self.estimate_tokens(block) for block in comment_blocks[:comments_dropped])
+
+        text_parts = [post_block]
+        if comment_blocks:
+            text_parts.append(header)
+            if comments_dropped:
+                text_parts.append(self.omission_note(comments_dropped))
+            text_parts.extend(kept_blocks)
+            text_parts.append("\n")
+        text = "".join(text_parts)
+
+        comment_ids = [comment_id for comment_id in analyzed_ids[comments_dropped:] if comment_id]
+        return ThreadPrompt(text, self.estimate_tokens(text), tokens_dropped, comments_dropped, comment_ids)
+
+    def pack(self, comment_blocks, budget):
+        """Returns the newest comment blocks that fit in budget tokens, oldest first."""
+        kept_blocks = []
+        for block in reversed(comment_blocks):
+            block_tokens = self.estimate_tokens(block)
+            if block_tokens > budget:
+                break
+            kept_blocks.insert(0, block)
+            budget -= block_tokens
+        return kept_blocks
+
+    @staticmethod
+    def omission_note(comments_dropped):
+        return f"[{comments_dropped} older comments omitted to fit the context budget]\n---\n"
+
+    def render_post(self, original_post, max_body_tokens):
+        """Renders the original post block, truncating its body to max_body_tokens (None keeps all of it)."""
+        post_parts = ["--- Original Post ---\n", f"Title: {original_post.title}\n"]
+        if original_post.selftext:
+            selftext = original_post.selftext if max_body_tokens is None else self.truncate(original_post.selftext, max_body_tokens)
+            post_parts.append(f"Content: {selftext}\n")
+        author_name = original_post.author.name if original_post.author else '[Deleted User]'
+        post_parts.append(f"By: u/{author_name}\n")
+        post_parts.append("---\n\n")
+        return "".join(post_parts)
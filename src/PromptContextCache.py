@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+
+from google.genai import errors
+
+from Metrics import metrics
+
+
+class PromptContextCache:
+    """
+    Registers the static prompts sent with every Gemini request as cached content with
+    the provider, so each request only carries the thread text and the prompt tokens
+    are billed at the cached rate.
+
+    One cache is kept per (model, prompt text). Its TTL is extended when it is used
+    within refresh_margin seconds of expiring, so prompts in regular use never lapse and
+    unused ones expire on their own. Prompts estimated below min_tokens are never
+    registered, since the provider rejects caches that small. If creating or refreshing
+    a cache fails, get() returns None and callers send the prompt inline as before; the
+    failed prompt is not retried for retry_after seconds.
+    """
+
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, client, ttl=3600, refresh_margin=300, min_tokens=1024, retry_after=900):
+        self.API = client
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}  # (model, prompt hash) -> (cache name, expires at)
+        self._unavailable = {}  # (model, prompt hash) -> time after which creating it is tried again
+
+    def _key(self, model, prompt):
+        return model, hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    def get(self, model, prompt_name, prompt):
+        """Returns the name of a live cache holding prompt for model, creating or refreshing it as needed, or None."""
+        if len(prompt) / self.CHARS_PER_TOKEN < self.min_tokens:
+            return None
+
+        key = self._key(model, prompt)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Only one thread creates or refreshes a given cache; the others wait and reuse it
+        with key_lock:
+            now = time.time()
+            if self._unavailable.get(key, 0) > now:
+                return None
+
+            entry = self._entries.get(key)
+            if entry:
+                name, expires_at = entry
+                if expires_at - now > self.refresh_margin:
+                    metrics.increment("prompt_cache.hits")
+                    return name
+                if expires_at - now > 0 and self._refresh(key, name, prompt_name):
+                    metrics.increment("prompt_cache.hits")
+                    return name
+                self._entries.pop(key, None)
+
+            return self._create(key, model, prompt_name, prompt)
+
+    def _create(self, key, model, prompt_name, prompt):
+        try:
+            with metrics.timer("prompt_cache.create"):
+                cached = self.API.caches.create(
+                    model=model,
+                    config={
+                        "display_name": prompt_name,
+                        "contents": [prompt],
+                        "ttl": f"{self.ttl}s",
+                    },
+                )
+        except Exception as e:
+            print(f"Could not cache prompt '{prompt_name}' for {model}, sending it inline: {e}")
+            metrics.increment("prompt_cache.unavailable")
+            self._unavailable[key] = time.time() + self.retry_after
+            return None
+
+        self._entries[key] = (cached.name, time.time() + self.ttl)
+        print(f"Cached prompt '{prompt_name}' for {model} as {cached.name} (TTL {self.ttl}s)")
+        metrics.increment("prompt_cache.created")
+        return cached.name
+
+    def _refresh(self, key, name, prompt_name):
+        try:
+            self.API.caches.update(name=name, config={"ttl": f"{self.ttl}s"})
+        except Exception as e:
+            print(f"Could not refresh cached prompt '{prompt_name}' ({name}), creating a new one: {e}")
+            return False
+        self._entries[key] = (name, time.time() + self.ttl)
+        metrics.increment("prompt_cache.refreshed")
+        return True
+
+    def invalidate(self, name):
+        """Forgets a cache the provider no longer knows about (e.g. it expired or was deleted)."""
+        with self._lock:
+            for key, (entry_name, _) in list(self._entries.items()):
+                if entry_name == name:
+                    self._entries.pop(key, None)
+        metrics.increment("prompt_cache.invalidated")
+
+    @staticmethod
+    def is_cache_error(error):
+        """True for request errors caused by a missing or expired cached content reference."""
+        return isinstance(error, errors.APIError) and (
+            error.code in (403, 404) or (error.code == 400 and "cache" in str(error).lower())
+        )
+
+    def close(self):
+        """Deletes every cache created by this process, so stopped bots don't keep paying for storage."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for name, _ in entries:
+            try:
+                self.API.caches.delete(name=name)
+            except Exception as e:
+                print(f"Error deleting cached prompt {name}: {e}")
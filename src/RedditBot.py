@@ -1,125 +1,339 @@
 import re
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import TimeoutError, as_completed
 
 from dotenv import load_dotenv
 import os
 import praw
 
+from AnalysisWriter import AnalysisWriter
 from DatabaseHelper import DatabaseHelper
+from FactCheckCache import FactCheckCache
 from GenAI import GenAI
-
+from Metrics import metrics
+from PromptBuilder import ThreadPromptBuilder
+from ReplyRenderer import STATS_CATEGORIES, ReplyRenderer
+from ResponseCache import ResponseCache
+from ThreadContext import ThreadContextFetcher
+from WorkerPool import WorkerPool
+
+COMMANDS = ("!analyze", "!factcheck", "!fullanalysis", "!stats")
+
+# A job picked up again after a restart, handled by the worker pool like an inbox item
+ResumedJob = namedtuple("ResumedJob", ["comment", "command", "command_args"])
+# A mention seen on a monitored subreddit's comment stream rather than in the inbox, already parsed
+StreamedComment = namedtuple("StreamedComment", ["comment", "command", "command_args"])
+
+def createRedditClient(shard=None):
+    """
+    Creates a PRAW client from REDDIT_CLIENT_ID/SECRET/USERNAME/PASSWORD, or for a shard
+    worker from REDDIT_SHARD_<shard>_CLIENT_ID/SECRET/USERNAME/PASSWORD, so every shard
+    posts from its own account and draws on its own API rate limit.
+    """
+    prefix = "REDDIT_" if shard is None else f"REDDIT_SHARD_{shard}_"
+    return praw.Reddit(
+        client_id=os.getenv(f"{prefix}CLIENT_ID"),
+        client_secret=os.getenv(f"{prefix}CLIENT_SECRET"),
+        username=os.getenv(f"{prefix}USERNAME"),
+        password=os.getenv(f"{prefix}PASSWORD"),
+        user_agent="ArgumentAnalyzer by u/ArgumentAnalyzerBot"  # Match your bot's actual username
+    )
 
 class RedditBot:
-    def __init__(self):
-        self.API = praw.Reddit(
-            client_id=os.getenv("REDDIT_CLIENT_ID"),
-            client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-            username=os.getenv("REDDIT_USERNAME"),
-            password=os.getenv("REDDIT_PASSWORD"),
-            user_agent="ArgumentAnalyzer by u/ArgumentAnalyzerBot"  # Match your bot's actual username
-        )
-        self.GenAI = GenAI()
-        self.DB = DatabaseHelper()
-
-    def get_ancestor_comments_and_post(self,start_comment):
+    def __init__(self, reddit=None, genai_client=None, db=None):
         """
-        Traverses up the comment tree from a starting comment
-        to the original post, collecting all ancestor comments.
+        reddit, genai_client and db default to the live PRAW client, Gemini client and
+        database; passing stand-ins lets the bot run offline (see benchmarks/).
         """
-        path = []
-        current_item = start_comment
+        self.API = reddit or createRedditClient()
+        self.DB = db or DatabaseHelper()
+        # Analyses are stored by a background writer in batches, so replies never wait on the database
+        self.writer = AnalysisWriter(
+            self.DB,
+            batch_size=int(os.getenv("WRITER_BATCH_SIZE", "50")),  # Analyses per commit
+            flush_interval=float(os.getenv("WRITER_FLUSH_INTERVAL", "1.0")),  # Seconds a queued analysis may wait for a batch
+            max_queue=int(os.getenv("WRITER_QUEUE_SIZE", "1000"))
+        )
+        self.GenAI = GenAI(
+            client=genai_client,
+            cache=ResponseCache(
+                self.DB,
+                max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "2000")),
+                max_age=int(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds
+            ),
+            factcheck_cache=FactCheckCache(
+                self.DB,
+                ttl=int(os.getenv("FACTCHECK_CACHE_TTL", str(3 * 24 * 3600)))  # Seconds until a verdict is re-checked
+            )
+        )
+        self.threadContext = ThreadContextFetcher(
+            self.API,
+            ttl=int(os.getenv("THREAD_CACHE_TTL", "300")),  # Seconds a loaded comment forest is reused
+            max_submissions=int(os.getenv("THREAD_CACHE_SIZE", "64"))
+        )
 
-        while True:
-            parent = current_item.parent()
-            if isinstance(parent, praw.models.Submission):
-                # print(f"Reached original post (Submission): {parent.title} ({parent.url})")
-                break
+        # Estimated token budget for the thread text sent with each command
+        self.prompt_token_budgets = {
+            "!analyze": int(os.getenv("PROMPT_TOKEN_BUDGET_ANALYZE", "24000")),
+            "!factcheck": int(os.getenv("PROMPT_TOKEN_BUDGET_FACTCHECK", "16000")),
+            "!fullanalysis": int(os.getenv("PROMPT_TOKEN_BUDGET_FULLANALYSIS", "24000")),
+        }
+        self.promptBuilder = ThreadPromptBuilder(
+            max_post_tokens=int(os.getenv("PROMPT_MAX_POST_TOKENS", "4000")),
+            max_comment_tokens=int(os.getenv("PROMPT_MAX_COMMENT_TOKENS", "2000"))
+        )
 
-            elif isinstance(parent, praw.models.Comment):
-                path.insert(0, parent)
-                current_item = parent
-                # print(f"Traversing up to parent comment: {current_item.body[:50]}...")
-            else:
-                print("Unexpected parent type or end of tree without reaching submission.")
-                break
+        # Reuse stored per-comment analyses instead of re-analyzing the whole chain on every !analyze.
+        self.incremental_analysis = os.getenv("INCREMENTAL_ANALYSIS", "1") == "1"
+
+        # Overlap claim extraction with fact-checking by streaming the extraction response
+        self.streaming_factcheck = os.getenv("STREAMING_FACTCHECK", "1") == "1"
+
+        # Replies longer than one Reddit comment are split into a chain of at most REPLY_MAX_PARTS comments
+        self.renderer = ReplyRenderer(max_parts=int(os.getenv("REPLY_MAX_PARTS", "3")))
+
+        # Number of most recent links listed per category in a !stats reply
+        self.stats_links_per_category = int(os.getenv("STATS_LINKS_PER_CATEGORY", "10"))
 
-        return path, parent
+        # Attempts per job before it is left in the failed state
+        self.job_max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
 
-    def constructThreadPrompt(self,original_post,ancestor_comments):
-        comment_thread_for_analysis = ""
-        if original_post:
-            comment_thread_for_analysis += f"--- Original Post ---\n"
-            comment_thread_for_analysis += f"Title: {original_post.title}\n"
-            if original_post.selftext:
-                comment_thread_for_analysis += f"Content: {original_post.selftext}\n"
-            author_name = original_post.author.name if original_post.author else '[Deleted User]'
-            comment_thread_for_analysis += f"By: u/{author_name}\n"
-            comment_thread_for_analysis += "---\n\n"
+        # Size of the inbox worker pool; 0 handles every item inline on the stream thread.
+        self.worker_count = int(os.getenv("WORKER_COUNT", "4"))
+        # Per-worker queue size. When a worker's queue is full, the inbox stream blocks.
+        self.worker_queue_size = int(os.getenv("WORKER_QUEUE_SIZE", "16"))
 
-        if ancestor_comments:
-            comment_thread_for_analysis += "--- Comment Thread --- (Oldest to Newest, excluding trigger comment)\n"
-            for comment_ancestor in ancestor_comments:
-                author_name = comment_ancestor.author.name if comment_ancestor.author else '[Deleted User]'
-                comment_thread_for_analysis += f"Comment ID: {comment_ancestor.id}\nUser ({author_name}): {comment_ancestor.body}\n---\n"
-            comment_thread_for_analysis += "\n"
+        # Sharded mode: the coordinator only enqueues jobs, shard workers poll the Jobs table for them
+        self.run_jobs_inline = True
+        self.job_poll_interval = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))  # Seconds an idle shard worker waits
+        # Seconds after which a running job is assumed abandoned by a dead worker and handed out again
+        self.job_lease_seconds = int(os.getenv("JOB_LEASE_SECONDS", "900"))
+        # Seconds between lease renewals of a shard worker's running jobs; must stay well below JOB_LEASE_SECONDS
+        self.job_heartbeat_interval = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(self.job_lease_seconds / 3)))
 
-        return comment_thread_for_analysis
+        # Analyses older than RETENTION_DAYS are rolled up into monthly stats and deleted (0 keeps everything)
+        self.retention_days = float(os.getenv("RETENTION_DAYS", "180"))
+        self.retention_interval = int(os.getenv("RETENTION_INTERVAL", str(6 * 3600)))  # Seconds between retention passes
+
+        # Subreddits whose comment streams are watched for mentions in addition to the inbox, e.g. "news+politics"
+        self.monitored_subreddits = [name.strip() for name in os.getenv("MONITORED_SUBREDDITS", "").replace(",", "+").split("+") if name.strip()]
+
+        # The bot's username and mention pattern, resolved once by resolveIdentity()
+        self.username = None
+        self.mention_marker = None
+        self.mention_pattern = None
+
+    def get_ancestor_comments_and_post(self,start_comment):
+        """
+        Collects all ancestor comments of a starting comment up to
+        the original post, resolved from the cached comment forest.
+        """
+        with metrics.timer("reddit.ancestor_fetch"):
+            return self.threadContext.get_ancestors(start_comment)
+
+    def constructThreadPrompt(self,original_post,ancestor_comments,prior_analyses=None,command="!analyze"):
+        """
+        Builds the thread text sent to Gemini within the command's token budget.
+        Comments with an entry in prior_analyses (redditCommentID -> stored CommentAnalysis row)
+        are included as compact summaries for context only, so the model does not analyze them again.
+        Returns the ThreadPrompt; its comment_ids are the comments the model is asked to cover.
+        """
+        with metrics.timer("prompt_build"):
+            thread_prompt = self.promptBuilder.build(original_post, ancestor_comments, self.prompt_token_budgets[command], prior_analyses)
+        metrics.increment(f"tokens.{command}.thread_prompt", thread_prompt.tokens_used)
+        metrics.increment(f"tokens.{command}.dropped", thread_prompt.tokens_dropped)
+        print(f"Thread prompt for {command}: ~{thread_prompt.tokens_used} tokens used, ~{thread_prompt.tokens_dropped} tokens dropped ({thread_prompt.comments_dropped} comments omitted)")
+        return thread_prompt
+
+    def mergeAnalyses(self, ancestor_comments, prior_analyses, analysis_output):
+        """
+        Combines stored per-comment analyses with a fresh analysis of the remaining comments.
+
+        Returns the merged output used for the reply (in thread order) and the fresh-only
+        output, which is what gets stored so earlier rows keep their original analysis.
+        """
+        fresh_entries = [entry for entry in analysis_output['analysis_entries'] if entry.get('comment_id') not in prior_analyses]
+        fresh_by_id = {entry.get('comment_id'): entry for entry in fresh_entries}
+        ancestor_ids = {comment_ancestor.id for comment_ancestor in ancestor_comments}
+
+        # Entries that do not belong to a comment in the chain (e.g. the original post) come first
+        merged_entries = [entry for entry in fresh_entries if entry.get('comment_id') not in ancestor_ids]
+        for comment_ancestor in ancestor_comments:
+            prior = prior_analyses.get(comment_ancestor.id)
+            if prior:
+                merged_entries.append({
+                    "username": prior['author'],
+                    "comment_id": comment_ancestor.id,
+                    "comment_summary": prior['comment_summary'],
+                    "argument_type": prior['argument_type'],
+                    "fallacy_type": prior['fallacy_type'],
+                    "flaw_description": prior['flaw_description'],
+                })
+            elif comment_ancestor.id in fresh_by_id:
+                merged_entries.append(fresh_by_id[comment_ancestor.id])
+
+        merged_output = dict(analysis_output, analysis_entries=merged_entries)
+        fresh_output = dict(analysis_output, analysis_entries=fresh_entries)
+        return merged_output, fresh_output
 
     def performFallacyAnalysis(self, comment):
         print(f"Bot triggered by comment: {comment.id} by {comment.author}")
         ancestor_comments, original_post = self.get_ancestor_comments_and_post(comment)
-        comment_thread_for_analysis = self.constructThreadPrompt(original_post,ancestor_comments)
+
+        prior_analyses = {}
+        if self.incremental_analysis and ancestor_comments:
+            ancestor_ids = [comment_ancestor.id for comment_ancestor in ancestor_comments]
+            prior_analyses = self.DB.get_comment_analyses(ancestor_ids)
+            prior_analyses.update(self.writer.pending_comment_analyses(ancestor_ids))  # Queued analyses are newer than stored ones
+            if prior_analyses:
+                print(f"Reusing {len(prior_analyses)} of {len(ancestor_comments)} stored comment analyses.")
+        thread_prompt = self.constructThreadPrompt(original_post,ancestor_comments,prior_analyses)
 
         analysis_output = None
+        stored_output = None
         if not ancestor_comments and (not original_post.selftext and not original_post.title):
-            reply_text = f"u/{comment.author}: It seems there are no parent comments or original post content for me to analyze in this thread. Please ensure the mention is in a comment that is part of a discussion you want analyzed."
-            print(reply_text)
+            replies = [self.nothingToAnalyzeReply(comment)]
         else:
-            analysis_output = self.GenAI.analyze_comment_thread_for_flaws(comment_thread_for_analysis)
-
-            formatted_analysis = f"**Overall Discussion Analysis requested by u/{comment.author}:**\n {analysis_output['overall_summary']} ({analysis_output['overall_argument_type'].replace('_', ' ').capitalize()})\n\n"
-            formatted_analysis += "**Individual Comment Breakdown:**\n"
-
-            if analysis_output['analysis_entries']:
-                for entry in analysis_output['analysis_entries']:
-                    formatted_analysis += f"- **u/{entry['username']}** (Type: {entry['argument_type'].replace('_', ' ').capitalize()}):\n"
-                    formatted_analysis += f"  > *{entry['comment_summary']}*  \n"  # Using blockquote for summary
-                    if entry['argument_type'] == "fallacy" and entry['fallacy_type']:
-                        formatted_analysis += f"  **Fallacy Type:** {entry['fallacy_type']}  \n"
-                    if entry['flaw_description']:
-                        formatted_analysis += f"  **Explanation:** {entry['flaw_description']}\n"
-                    formatted_analysis += "\n"  # Add extra newline for readability between entries
-            else:
-                formatted_analysis += "  *No specific arguments identified in the comments.*\n\n"
-
-            reply_text = f"**Argument Quality Analysis:**\n\n{formatted_analysis}For more information about fallacies visit: https://en.wikipedia.org/wiki/List_of_fallacies\n\n---\n\n*Beep boop. I am a bot. This analysis is generated by AI and may not be perfect. The analysis focused on the discussion thread leading up to this comment.*"
+            analysis_output = self.GenAI.analyze_comment_thread_for_flaws(thread_prompt.text, thread_prompt.comment_ids)
+            analysis_output, stored_output = self.mergeAnalyses(ancestor_comments, prior_analyses, analysis_output)
+            replies = self.renderer.render_analysis(comment.author, analysis_output)
 
         try:
-            reply = comment.reply(reply_text)
-            if analysis_output:
-                self.DB.storeAnalysis(original_post, comment.id, reply.id, analysis_output)
-            print(f"Replied to comment {comment.id}")
+            reply = self.postReplies(comment, replies)
         except praw.exceptions.RedditAPIException as e:
             print(f"Error replying to comment {comment.id}: {e}")
+            return None
         except Exception as e:
             print(f"An unexpected error occurred while replying: {e}")
+            return None
+
+        print(f"Replied to comment {comment.id}")
+        if stored_output:
+            self.storeAnalysis(original_post, comment, reply, stored_output)
+        return reply
 
 
 
+    def storeAnalysis(self, original_post, comment, reply, analysis):
+        """Queues a posted analysis for storage. Failures are only logged: the reply is already visible."""
+        try:
+            self.writer.put(original_post, comment.id, reply.id, analysis)
+        except Exception as e:
+            print(f"Error queuing the analysis of comment {comment.id} for storage: {e}")
+
+    def nothingToAnalyzeReply(self, comment):
+        reply_text = f"u/{comment.author}: It seems there are no parent comments or original post content for me to analyze in this thread. Please ensure the mention is in a comment that is part of a discussion you want analyzed."
+        print(reply_text)
+        return reply_text
+
+    def postReply(self, comment, reply_text):
+        with metrics.timer("reddit.reply"):
+            return comment.reply(reply_text)
+
+    def postReplies(self, comment, replies):
+        """
+        Posts a rendered reply series, each part as a reply to the previous one, and returns
+        the first reply. Failures after the first part are logged, since the reply is already visible.
+        """
+        first_reply = self.postReply(comment, replies[0])
+        parent = first_reply
+        for index, reply_text in enumerate(replies[1:], start=2):
+            try:
+                parent = self.postReply(parent, reply_text)
+            except Exception as e:
+                print(f"Error posting part {index} of {len(replies)} of the reply to comment {comment.id}: {e}")
+                break
+        if len(replies) > 1:
+            metrics.increment("replies.chained")
+        return first_reply
+
+    def factcheckThread(self, thread_prompt):
+        """
+        Extracts claims from the thread prompt and fact-checks them, returning
+        (claim entry, result) pairs in claim order. In streaming mode each claim is
+        sent for verification as soon as it has been parsed from the extraction
+        response, so extraction and verification overlap.
+        """
+        if self.streaming_factcheck:
+            claim_entries = self.GenAI.stream_claims_from_thread(thread_prompt.text, comment_ids=thread_prompt.comment_ids)
+        else:
+            claim_entries = self.GenAI.extract_claims_from_thread(thread_prompt.text, thread_prompt.comment_ids)['claim_entries']
+        return self.factcheckClaimEntries(claim_entries)
+
+    def factcheckClaimEntries(self, claim_entries):
+        """Fact-checks claim entries concurrently, submitting each as it arrives; returns (entry, result) pairs in claim order."""
+        futures = {}
+        for entry in claim_entries:
+            if not entry.get('claim'):
+                continue  # Skip if claim is empty or invalid
+            future = self.GenAI.executor.submit(self.GenAI.factcheck_claim, entry['claim'], entry.get('arguments_entries', []))
+            futures[future] = (len(futures), entry)
+
+        results = [None] * len(futures)
+        try:
+            for future in as_completed(futures, timeout=max(0.0, self.GenAI.factcheck_deadline() - time.monotonic())):
+                index, entry = futures[future]
+                try:
+                    results[index] = (entry, future.result())
+                except Exception as e:
+                    print(f"Fact-check failed for claim '{entry['claim']}': {e}")
+        except TimeoutError:
+            print(f"Timed out waiting for {results.count(None)} fact-checks.")
+        return [result for result in results if result is not None]
+
     def performClaimAnalysis(self, comment):
         print(f"Bot triggered by comment: {comment.id} by {comment.author}")
         ancestor_comments, original_post = self.get_ancestor_comments_and_post(comment)
-        comment_thread_for_analysis = self.constructThreadPrompt(original_post, ancestor_comments)
+        thread_prompt = self.constructThreadPrompt(original_post, ancestor_comments, command="!factcheck")
+
+        if not ancestor_comments and (not original_post.selftext and not original_post.title):
+            replies = [self.nothingToAnalyzeReply(comment)]
+        else:
+            factcheck_results = self.factcheckThread(thread_prompt)
+            replies = self.renderer.render_factcheck(comment.author, factcheck_results)
+
+        try:
+            reply = self.postReplies(comment, replies)
+            print(f"Replied to comment {comment.id}")
+            return reply
+        except praw.exceptions.RedditAPIException as e:
+            print(f"Error replying to comment {comment.id}: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred while replying: {e}")
+
+    def performFullAnalysis(self, comment):
+        """
+        Handles !fullanalysis: one Gemini request returns both the fallacy breakdown and the
+        extracted claims, which are then fact-checked. Stored analyses are not reused here,
+        because claim extraction needs the full text of every comment.
+        """
+        print(f"Bot triggered by comment: {comment.id} by {comment.author}")
+        ancestor_comments, original_post = self.get_ancestor_comments_and_post(comment)
+        thread_prompt = self.constructThreadPrompt(original_post, ancestor_comments, command="!fullanalysis")
 
         analysis_output = None
         if not ancestor_comments and (not original_post.selftext and not original_post.title):
-            reply_text = f"u/{comment.author}: It seems there are no parent comments or original post content for me to analyze in this thread. Please ensure the mention is in a comment that is part of a discussion you want analyzed."
-            print(reply_text)
+            replies = [self.nothingToAnalyzeReply(comment)]
         else:
-            claim_json = self.GenAI.extract_claims_from_thread(comment_thread_for_analysis)
-            reply_text = self.GenAI.factcheckClaims(claim_json)
+            analysis_output = self.GenAI.analyze_thread_and_extract_claims(thread_prompt.text, thread_prompt.comment_ids)
+            factcheck_results = self.factcheckClaimEntries(analysis_output['claim_entries'])
+            replies = self.renderer.render_full_analysis(comment.author, analysis_output, factcheck_results)
 
-        print(reply_text)
+        try:
+            reply = self.postReplies(comment, replies)
+        except praw.exceptions.RedditAPIException as e:
+            print(f"Error replying to comment {comment.id}: {e}")
+            return None
+        except Exception as e:
+            print(f"An unexpected error occurred while replying: {e}")
+            return None
+
+        print(f"Replied to comment {comment.id}")
+        if analysis_output:
+            self.storeAnalysis(original_post, comment, reply, analysis_output)
+        return reply
 
     def getStats(self, item, command_args):
         target_username = item.author.name  # Default to author of triggering comment
@@ -127,126 +341,343 @@ class RedditBot:
             # Allow specifying a username, e.g., !userstats SomeUser
             target_username = command_args[0].replace('u/', '').strip()
 
-        history_entries = self.DB.get_user_analysis_history(target_username)
-
-        if not history_entries:
-            reply_text = f"u/{item.author}: No analysis history found for u/{target_username}."
-        else:
-            valid_count = 0
-            fallacy_count = 0
-            no_argument_count = 0
-            score = 0  # Score calculation: +1 for valid, -1 for fallacy
-
-            valid_comments_links = []
-            fallacy_comments_links = []
-            no_argument_comments_links = []
-
-            for entry in history_entries:
-                comment_permalink = f"https://reddit.com/r/{entry['redditCommunity']}/comments/{entry['redditThreadID']}/comment/{entry['redditCommentID']}/"
-
-                # Create a concise string for the link list
-                link_item = f"([Link]({comment_permalink})) in r/{entry['redditCommunity']} (Overall: {entry['context_overall_argument_type'].replace('_', ' ').capitalize()})"
-
-                if entry['argument_type'] == 'valid_argument':
-                    valid_count += 1
-                    score += 1
-                    valid_comments_links.append(link_item)
-                elif entry['argument_type'] == 'fallacy':
-                    fallacy_count += 1
-                    score -= 1
-                    # Add fallacy type to link item for more context
-                    fallacy_type_str = f" - {entry['fallacy_type']}" if entry['fallacy_type'] else ""
-                    fallacy_comments_links.append(f"{link_item}{fallacy_type_str}")
-                elif entry['argument_type'] == 'no_argument_found':
-                    no_argument_count += 1
-                    no_argument_comments_links.append(link_item)
-
-            total_analyzed = valid_count + fallacy_count + no_argument_count
-
-            # Get current timestamp
-            from datetime import datetime  # Import datetime module
-            current_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")  # Format timestamp
-
-            reply_text = f"**Argumentation Stats for u/{target_username} (requested by u/{item.author}):**\n\n"
-            reply_text += f"*(Stats generated on: {current_time_str})*\n\n"  # Add timestamp
-
-            reply_text += f"- **Total Comments Analyzed:** {total_analyzed}  \n"
-            reply_text += f"- **Valid Arguments:** {valid_count}  \n"
-            reply_text += f"- **Fallacies Detected:** {fallacy_count}  \n"
-            reply_text += f"- **No Arguments Found:** {no_argument_count}  \n"
-            reply_text += f"- **Overall Score:** {score}  \n"  # Present the score
-
-            reply_text += "\n**Details by Type:**\n"
-
-            if valid_comments_links:
-                reply_text += "**Valid Arguments:**\n"
-                for link in valid_comments_links:
-                    reply_text += f"* {link}\n"
-            else:
-                reply_text += "No valid arguments detected yet.\n"
-            reply_text += "\n"  # Blank line for spacing
-
-            if fallacy_comments_links:
-                reply_text += "**Fallacies Detected:**\n"
-                for link in fallacy_comments_links:
-                    reply_text += f"* {link}\n"
-            else:
-                reply_text += "No fallacies detected yet.\n"
-            reply_text += "\n"  # Blank line for spacing
-
-            if no_argument_comments_links:
-                reply_text += "**No Arguments Found:**\n"
-                for link in no_argument_comments_links:
-                    reply_text += f"* {link}\n"
-            else:
-                reply_text += "No comments classified as 'no argument found' yet.\n"
-
-            reply_text += "\n---\n\n*Score: +1 for each valid argument, -1 for each fallacy.*"
-            reply_text += "\n*These stats reflect only comments analyzed by this bot.*"
+        # Counts are aggregated in SQL so they don't require loading the user's whole history
+        type_counts = self.DB.get_user_stats(target_username)
+        recent_entries = {
+            argument_type: self.DB.get_user_recent_analyses(target_username, argument_type, self.stats_links_per_category)
+            for argument_type, _, _ in STATS_CATEGORIES if type_counts.get(argument_type)
+        }
+        replies = self.renderer.render_stats(item.author, target_username, type_counts, recent_entries)
 
         try:
-            item.reply(reply_text)
+            reply = self.postReplies(item, replies)
             print(f"Replied to comment {item.id}")
+            return reply
         except praw.exceptions.RedditAPIException as e:
             print(f"Error replying to comment {item.id}: {e}")
         except Exception as e:
             print(f"An unexpected error occurred while replying: {e}")
 
-    def handleComment(self, comment):
-        bot_username_lower = self.API.user.me().name.lower()
+    def resolveIdentity(self):
+        """Looks up the bot's username once and compiles the mention pattern used for every item."""
+        if self.mention_pattern is None:
+            self.username = self.API.user.me().name
+            self.mention_marker = f"u/{self.username.lower()}"
+            self.mention_pattern = re.compile(r'u/' + re.escape(self.username) + r'\s*(![a-zA-Z0-9_]+)(.*)', re.IGNORECASE)
+        return self.username
+
+    def parseMention(self, comment):
+        """Returns (command, command_args) if the comment mentions the bot with a command, else None."""
+        self.resolveIdentity()
+        body = comment.body
+        # Substring check first: almost every streamed comment fails it without running the regex
+        if self.mention_marker not in body.lower():
+            return None
+        match = self.mention_pattern.search(body)
+        if not match:
+            return None
+        command_args_str = match.group(2).strip()
+        return match.group(1).lower(), command_args_str.split() if command_args_str else []
+
+    def queueCommand(self, comment, command, command_args):
+        """Records the job durably, then runs it unless shard workers pick it up. Returns False for duplicates."""
+        is_new = self.DB.enqueue_job(comment.id, command, command_args, threadID=self.orderingKey(comment))
+        if not is_new:
+            print(f"Job for comment {comment.id} already exists. Skipping duplicate.")
+        return is_new
+
+    def startCommand(self, comment, command, command_args):
+        if self.run_jobs_inline:
+            self.runJob(comment, command, command_args)
+        else:
+            print(f"Queued {command} for comment {comment.id} for a shard worker.")
 
-        match = re.search(r'u/' + re.escape(bot_username_lower) + r'\s*(![a-zA-Z0-9_]+)(.*)', comment.body, re.IGNORECASE)
+    def handleComment(self, comment):
+        # Subreddit stream items have no was_comment attribute; reading it through PRAW would trigger a fetch
+        mention = self.parseMention(comment) if vars(comment).get("was_comment", True) else None
 
-        if match and comment.was_comment:
-            command = match.group(1).lower()
-            command_args_str = match.group(2).strip()
-            command_args = command_args_str.split() if command_args_str else []
+        if mention:
+            command, command_args = mention
 
             print(f"Bot mentioned in comment {comment.id} by {comment.author} with command: {command} args: {command_args}")
 
-            if command == "!analyze":
-                self.performFallacyAnalysis(comment)
-            elif command == "!factcheck":
-                self.performClaimAnalysis(comment)
-            elif command == "!stats":
-                self.getStats(comment,command_args)
+            if command in COMMANDS:
+                # Record the job durably before marking the item read, so a crash cannot lose it
+                is_new = self.queueCommand(comment, command, command_args)
+                comment.mark_read()
+                if is_new:
+                    self.startCommand(comment, command, command_args)
+                return
             else:
                 print(
                     f"Bot mentioned in {comment.id} but no specific analysis command found. Marking as read.")
         else:
             print(f"Item {comment.id} is not a relevant mention. Marking as read.")
+        comment.mark_read()
+
+    def parseStreamedComment(self, comment):
+        """
+        Returns the StreamedComment for a comment from a monitored subreddit's stream, or None.
+        Runs on the stream thread: most comments don't mention the bot and are dropped by the
+        substring check before they ever reach a worker queue.
+        """
+        if comment.author and comment.author.name.lower() == self.resolveIdentity().lower():
+            return None
+        mention = self.parseMention(comment)
+        if not mention or mention[0] not in COMMANDS:
+            return None
+        return StreamedComment(comment, *mention)
+
+    def handleStreamedComment(self, comment, command, command_args):
+        """
+        Handles a command found on a monitored subreddit's stream. Nothing is marked read,
+        and a mention that also arrives through the inbox is deduplicated by the Jobs table.
+        """
+        print(f"Bot mentioned in comment {comment.id} on r/{comment.subreddit} by {comment.author} with command: {command} args: {command_args}")
+        if self.queueCommand(comment, command, command_args):
+            self.startCommand(comment, command, command_args)
+
+    def runJob(self, comment, command, command_args):
+        """Claims a queued job and runs it."""
+        if not self.DB.claim_job(comment.id):
+            print(f"Job for comment {comment.id} is not queued. Skipping.")
+            return
+        self.executeJob(comment, command, command_args)
+
+    def executeJob(self, comment, command, command_args):
+        """Runs a claimed job and records whether it was replied to or failed."""
+        metrics.increment(f"commands.{command}")
+        try:
+            with metrics.timer(f"command.{command}"):
+                if command == "!analyze":
+                    reply = self.performFallacyAnalysis(comment)
+                elif command == "!factcheck":
+                    reply = self.performClaimAnalysis(comment)
+                elif command == "!fullanalysis":
+                    reply = self.performFullAnalysis(comment)
+                else:
+                    reply = self.getStats(comment,command_args)
+        except Exception as e:
+            print(f"An unexpected error occurred while handling {command} for comment {comment.id}: {e}")
+            self.DB.fail_job(comment.id, str(e), self.job_max_attempts)
+            return
+
+        if reply:
+            self.DB.complete_job(comment.id, reply.id)
+        else:
+            metrics.increment(f"commands.{command}.failed")
+            self.DB.fail_job(comment.id, "Reply could not be posted.", self.job_max_attempts)
+
+    def resumeJobs(self):
+        """Returns the jobs left queued or running by a previous run, reset to queued."""
+        jobs = self.DB.get_resumable_jobs()
+        if jobs:
+            print(f"Resuming {len(jobs)} unfinished jobs from the previous run.")
+        return [ResumedJob(self.API.comment(job['triggerCommentID']), job['command'], job['args']) for job in jobs]
 
     def handlePM(self,pm):
         pass
 
-    def run(self):
-        print(f"Starting bot, listening for mentions for: {self.API.user.me()}")
+    def handleItem(self, item):
+        if isinstance(item, ResumedJob):
+            self.runJob(item.comment, item.command, item.command_args)
+        elif isinstance(item, StreamedComment):
+            self.handleStreamedComment(item.comment, item.command, item.command_args)
+        elif isinstance(item, praw.models.Comment):
+            self.handleComment(item)
+        elif isinstance(item, praw.models.Message):
+            self.handlePM(item)
+            item.mark_read()
+
+    def orderingKey(self, item):
+        """
+        Items with the same key are handled by the same worker in arrival order.
+        Comments are keyed on their submission so mentions within one thread never
+        race each other; PRAW derives the submission ID from the inbox item's context
+        link, so this does not cost a request.
+        """
+        if isinstance(item, StreamedComment):
+            item = item.comment
+        if isinstance(item, praw.models.Comment):
+            return item.submission.id
+        return None
+
+    def metricsDumpPath(self, shard=None):
+        dump_path = os.getenv("METRICS_DUMP_PATH")  # e.g. metrics.json, rewritten every METRICS_DUMP_INTERVAL seconds
+        if dump_path and shard is not None:
+            root, extension = os.path.splitext(dump_path)
+            dump_path = f"{root}.shard{shard}{extension}"
+        return dump_path
+
+    def startMetrics(self, shard=None):
+        """Starts metrics reporting; shard workers write their own file and serve on METRICS_PORT + shard."""
+        port = int(os.getenv("METRICS_PORT", "0"))  # Serves JSON on 127.0.0.1:<port>/metrics when set
+        if port and shard is not None:
+            port += shard
+        metrics.start_reporting(
+            dump_path=self.metricsDumpPath(shard),
+            interval=int(os.getenv("METRICS_DUMP_INTERVAL", "60")),
+            port=port
+        )
 
-        for item in self.API.inbox.stream():
-            if isinstance(item, praw.models.Comment):
-                self.handleComment(item)
-            elif isinstance(item, praw.models.Message):
-                self.handlePM(item)
+    def startSubredditStream(self, dispatch):
+        """
+        Watches the comment streams of MONITORED_SUBREDDITS on a background thread and passes
+        every new comment that mentions the bot with a command to dispatch as a StreamedComment;
+        all other comments are dropped on the stream thread. The stream is restarted after errors.
+        """
+        if not self.monitored_subreddits:
+            return None
+        subreddit_names = "+".join(self.monitored_subreddits)
+
+        def stream():
+            while True:
+                try:
+                    for comment in self.API.subreddit(subreddit_names).stream.comments(skip_existing=True):
+                        metrics.increment("stream.comments")
+                        streamed = self.parseStreamedComment(comment)
+                        if streamed:
+                            metrics.increment("stream.mentions")
+                            dispatch(streamed)
+                except Exception as e:
+                    print(f"Error in the comment stream for r/{subreddit_names}, restarting in 30s: {e}")
+                    time.sleep(30)
+
+        thread = threading.Thread(target=stream, name="subreddit-stream", daemon=True)
+        thread.start()
+        print(f"Watching comment streams of r/{subreddit_names}")
+        return thread
+
+    def startRetention(self):
+        """
+        Applies the retention policy and compacts the database every RETENTION_INTERVAL
+        seconds on a background thread. Only the process reading the inbox runs it, so
+        shard workers never compete for the write lock with it.
+        """
+        factcheck_max_age = self.GenAI.factcheck_cache.ttl if self.GenAI.factcheck_cache else None
+
+        def retain():
+            while True:
+                try:
+                    if self.retention_days > 0:
+                        with metrics.timer("db.retention"):
+                            rolled_up = self.DB.apply_retention(self.retention_days * 24 * 3600, factcheck_max_age)
+                        metrics.increment("db.retention.rolled_up", rolled_up)
+                    released = self.DB.compact()
+                    if released:
+                        print(f"Released {released} free database pages.")
+                except Exception as e:
+                    print(f"Error in the retention pass: {e}")
+                time.sleep(self.retention_interval)
+
+        thread = threading.Thread(target=retain, name="retention", daemon=True)
+        thread.start()
+        return thread
 
-            #item.mark_read()
-            time.sleep(1)
\ No newline at end of file
+    def run(self):
+        print(f"Starting bot, listening for mentions for: {self.resolveIdentity()}")
+        self.startMetrics()
+        self.startRetention()
+
+        resumed_jobs = self.resumeJobs()
+
+        if self.worker_count <= 0:
+            try:
+                for job in resumed_jobs:
+                    self.handleItem(job)
+                self.startSubredditStream(self.handleItem)
+                for item in self.API.inbox.stream():
+                    self.handleItem(item)
+            finally:
+                self.writer.close()
+                self.GenAI.close()
+                self.DB.close()
+                metrics.stop_reporting(os.getenv("METRICS_DUMP_PATH"))
+            return
+
+        pool = WorkerPool(self.handleItem, num_workers=self.worker_count, queue_size=self.worker_queue_size, name="inbox-worker")
+        print(f"Processing inbox with {self.worker_count} workers (queue size {self.worker_queue_size} each)")
+        try:
+            for job in resumed_jobs:
+                pool.submit(job)
+            self.startSubredditStream(lambda item: pool.submit(item, key=self.orderingKey(item)))
+            for item in self.API.inbox.stream():
+                pool.submit(item, key=self.orderingKey(item))
+        finally:
+            pool.shutdown()
+            self.writer.close()
+            self.GenAI.close()
+            self.DB.close()
+            metrics.stop_reporting(os.getenv("METRICS_DUMP_PATH"))
+
+    def runCoordinator(self):
+        """
+        Sharded mode, coordinator side: reads the inbox (and monitored subreddits) and
+        records every command as a queued job without running it. Shard workers (runShardWorker) pick the jobs up.
+        Jobs interrupted by a crashed worker are requeued by the workers once their lease
+        expires, so the coordinator does not reset running jobs on start.
+        """
+        print(f"Starting coordinator, listening for mentions for: {self.resolveIdentity()}")
+        self.run_jobs_inline = False
+        self.startMetrics()
+        self.startRetention()
+        try:
+            self.startSubredditStream(self.handleItem)
+            for item in self.API.inbox.stream():
+                self.handleItem(item)
+        finally:
+            self.writer.close()
+            self.GenAI.close()
+            self.DB.close()
+            metrics.stop_reporting(self.metricsDumpPath())
+
+    def runShardWorker(self, shard):
+        """
+        Sharded mode, worker side: claims queued jobs from the shared database and replies
+        from this shard's account. WORKER_COUNT threads (at least one) poll for jobs. While
+        the process is alive, a heartbeat thread renews the leases of its running jobs, so
+        a slow job is never handed to another shard; only a dead worker's leases expire.
+        """
+        worker_name = f"shard-{shard}:{self.API.user.me()}"
+        thread_count = max(1, self.worker_count)
+        print(f"Starting shard worker {worker_name} with {thread_count} threads")
+        self.startMetrics(shard)
+        stopping = threading.Event()
+        stopped = threading.Event()
+
+        def heartbeat():
+            while not stopped.wait(self.job_heartbeat_interval):
+                self.DB.renew_job_leases(worker_name)
+
+        def work():
+            while not stopping.is_set():
+                job = self.DB.claim_next_job(worker_name, self.job_lease_seconds)
+                if job is None:
+                    stopping.wait(self.job_poll_interval)
+                    continue
+                print(f"{worker_name} claimed {job['command']} for comment {job['triggerCommentID']}")
+                try:
+                    self.executeJob(self.API.comment(job['triggerCommentID']), job['command'], job['args'])
+                except Exception as e:
+                    print(f"{worker_name} failed to run the job for comment {job['triggerCommentID']}: {e}")
+                    self.DB.fail_job(job['triggerCommentID'], str(e), self.job_max_attempts)
+
+        threads = [threading.Thread(target=work, name=f"shard-{shard}-{index}", daemon=True) for index in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        threading.Thread(target=heartbeat, name=f"shard-{shard}-heartbeat", daemon=True).start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            print(f"Stopping shard worker {worker_name} after the jobs in flight")
+            stopping.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            stopped.set()
+            self.writer.close()
+            self.GenAI.close()
+            self.DB.close()
+            metrics.stop_reporting(self.metricsDumpPath(shard))
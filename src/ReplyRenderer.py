@@ -0,0 +1,288 @@
+from datetime import datetime
+from functools import lru_cache
+from string import Template
+
+REDDIT_COMMENT_LIMIT = 10000  # Maximum length of a Reddit comment in characters
+
+# (argument_type, section title, text shown when the user has no comments of that type)
+STATS_CATEGORIES = [
+    ("valid_argument", "Valid Arguments", "No valid arguments detected yet."),
+    ("fallacy", "Fallacies Detected", "No fallacies detected yet."),
+    ("no_argument_found", "No Arguments Found", "No comments classified as 'no argument found' yet."),
+]
+STATS_SECTION_RESERVE = 100  # Characters kept free per stats section for its title and omission note
+
+# --- Templates, compiled once at import ---
+ANALYSIS_HEADER = Template(
+    "**Argument Quality Analysis:**\n\n"
+    "**Overall Discussion Analysis requested by u/$author:**\n $overall_summary ($overall_argument_type)\n\n"
+    "**Individual Comment Breakdown:**\n"
+)
+ANALYSIS_ENTRY = Template("- **u/$username** (Type: $argument_type):\n  > *$comment_summary*  \n$fallacy_line$explanation_line\n")
+FALLACY_LINE = Template("  **Fallacy Type:** $fallacy_type  \n")
+EXPLANATION_LINE = Template("  **Explanation:** $flaw_description\n")
+NO_ANALYSIS_ENTRIES = "  *No specific arguments identified in the comments.*\n\n"
+ANALYSIS_FOOTER = (
+    "For more information about fallacies visit: https://en.wikipedia.org/wiki/List_of_fallacies\n\n---\n\n"
+    "*Beep boop. I am a bot. This analysis is generated by AI and may not be perfect. "
+    "The analysis focused on the discussion thread leading up to this comment.*"
+)
+
+FACTCHECK_HEADER = Template("**Fact-Check requested by u/$author:**\n\n")
+FACTCHECK_SECTION_HEADER = "**Fact-Check:**\n\n"
+FACTCHECK_CLAIM = Template("**Claim by u/$username:** $claim\n\n")
+FACTCHECK_VERDICT = Template("**Verdict:** $verdict$cache_note  \n$explanation\n\n")
+FACTCHECK_CACHE_NOTE = Template(" *(cached verdict, checked $age ago)*")
+FACTCHECK_ARGUMENT = Template("- *$argument_text* (**$argument_verdict**): $argument_explanation\n")
+FACTCHECK_SOURCE = Template("[[$number]]($url \"$title\")")
+NO_FACTCHECK_CLAIMS = "*No verifiable factual claims were found in the discussion thread.*\n\n"
+FACTCHECK_FOOTER = (
+    "---\n\n*Beep boop. I am a bot. These fact-checks are generated by AI using web search and may not be perfect. "
+    "Always check the sources yourself.*"
+)
+FULL_ANALYSIS_FOOTER = (
+    "For more information about fallacies visit: https://en.wikipedia.org/wiki/List_of_fallacies\n\n---\n\n"
+    "*Beep boop. I am a bot. This analysis and these fact-checks are generated by AI using web search and may not be perfect. "
+    "Always check the sources yourself.*"
+)
+
+STATS_HEADER = Template(
+    "**Argumentation Stats for u/$target (requested by u/$author):**\n\n"
+    "*(Stats generated on: $generated_at)*\n\n"
+    "- **Total Comments Analyzed:** $total  \n"
+    "- **Valid Arguments:** $valid  \n"
+    "- **Fallacies Detected:** $fallacies  \n"
+    "- **No Arguments Found:** $no_arguments  \n"
+    "- **Overall Score:** $score  \n"
+    "\n**Details by Type:**\n"
+)
+STATS_LINK = Template("* ([Link](https://reddit.com/r/$community/comments/$thread_id/comment/$comment_id/)) in r/$community (Overall: $overall)$fallacy\n")
+STATS_MORE = Template("* *...and $count more not shown.*\n")
+STATS_FOOTER = (
+    "\n---\n\n*Score: +1 for each valid argument, -1 for each fallacy.*"
+    "\n*These stats reflect only comments analyzed by this bot.*"
+)
+NO_STATS = Template("u/$author: No analysis history found for u/$target.")
+
+CONTINUATION_HEADER = Template("*(Continued from the previous reply, part $part of $parts)*\n\n")
+CONTINUATION_FOOTER = "*(Continued in the reply below)*"
+OMITTED_ENTRIES = Template("*...and $count more not shown: the full reply would not fit in $parts Reddit comments.*\n\n")
+TRUNCATED_BLOCK = "\n[... truncated]\n\n"
+
+
+@lru_cache(maxsize=256)
+def humanize(value):
+    """Turns an enum value like 'valid_argument' into 'Valid argument'."""
+    return value.replace('_', ' ').capitalize()
+
+
+def formatAge(seconds):
+    """Formats a duration in seconds as a short human readable age, e.g. '5 minutes'."""
+    for unit, length in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+    return "less than a minute"
+
+
+class ReplyRenderer:
+    """
+    Renders the bot's replies from precompiled templates.
+
+    Each reply is built as a header, a list of blocks (one per analyzed comment or
+    fact-checked claim) and a footer, then packed into as few Reddit comments as
+    possible. A reply that needs more than max_parts comments is collapsed instead:
+    the first comment keeps as many blocks as fit and notes how many were left out.
+    Every render method returns the list of comment bodies to post, in order; each
+    one is at most limit characters long.
+    """
+
+    def __init__(self, limit=REDDIT_COMMENT_LIMIT, max_parts=3):
+        self.limit = limit
+        self.max_parts = max(1, max_parts)
+        # Longest continuation header that can be emitted, reserved in every part after the first
+        self.continuation_reserve = len(CONTINUATION_HEADER.substitute(part=max_parts, parts=max_parts))
+
+    # --- Packing ---
+    def paginate(self, header, blocks, footer):
+        """Packs header, blocks and footer into at most max_parts comments, collapsing if they don't fit."""
+        blocks = [self._fit_block(block, header, footer) for block in blocks]
+        pages = self._pack(header, blocks, footer)
+        if len(pages) > self.max_parts:
+            return [self._collapse(header, blocks, footer)]
+
+        if len(pages) == 1:
+            return ["".join([header] + pages[0] + [footer])]
+
+        replies = []
+        for index, page in enumerate(pages):
+            parts = [header] if index == 0 else [CONTINUATION_HEADER.substitute(part=index + 1, parts=len(pages))]
+            parts.extend(page)
+            parts.append(footer if index == len(pages) - 1 else CONTINUATION_FOOTER)
+            replies.append("".join(parts))
+        return replies
+
+    def _fit_block(self, block, header, footer):
+        """Cuts a single block that could never fit in one comment on its own."""
+        # A block alone on a page may open with either header and close with either footer
+        opening = max(len(header), self.continuation_reserve)
+        closing = max(len(footer), len(CONTINUATION_FOOTER))
+        max_length = self.limit - opening - closing - len(TRUNCATED_BLOCK)
+        if len(block) <= max_length:
+            return block
+        return block[:max_length] + TRUNCATED_BLOCK
+
+    def _pack(self, header, blocks, footer):
+        # Every page reserves room for the larger of its possible closing lines
+        closing = max(len(footer), len(CONTINUATION_FOOTER))
+        pages = [[]]
+        used = len(header)
+        for block in blocks:
+            if pages[-1] and used + len(block) + closing > self.limit:
+                pages.append([])
+                used = self.continuation_reserve
+            pages[-1].append(block)
+            used += len(block)
+        return pages
+
+    def _collapse(self, header, blocks, footer):
+        # Leave room for the omission note, sized for the largest possible count
+        note_reserve = len(OMITTED_ENTRIES.substitute(count=len(blocks), parts=self.max_parts))
+        budget = self.limit - len(header) - len(footer) - note_reserve
+        kept = []
+        for block in blocks:
+            if len(block) > budget:
+                break
+            kept.append(block)
+            budget -= len(block)
+        omitted = len(blocks) - len(kept)
+        return "".join([header] + kept + [OMITTED_ENTRIES.substitute(count=omitted, parts=self.max_parts), footer])
+
+    # --- Analysis ---
+    def analysis_header(self, author, analysis_output):
+        return ANALYSIS_HEADER.substitute(
+            author=author,
+            overall_summary=analysis_output['overall_summary'],
+            overall_argument_type=humanize(analysis_output['overall_argument_type']),
+        )
+
+    def analysis_blocks(self, analysis_output):
+        if not analysis_output['analysis_entries']:
+            return [NO_ANALYSIS_ENTRIES]
+        blocks = []
+        for entry in analysis_output['analysis_entries']:
+            fallacy_type = entry.get('fallacy_type')
+            flaw_description = entry.get('flaw_description')
+            blocks.append(ANALYSIS_ENTRY.substitute(
+                username=entry['username'],
+                argument_type=humanize(entry['argument_type']),
+                comment_summary=entry['comment_summary'],
+                fallacy_line=FALLACY_LINE.substitute(fallacy_type=fallacy_type) if entry['argument_type'] == "fallacy" and fallacy_type else "",
+                explanation_line=EXPLANATION_LINE.substitute(flaw_description=flaw_description) if flaw_description else "",
+            ))
+        return blocks
+
+    def render_analysis(self, author, analysis_output):
+        return self.paginate(self.analysis_header(author, analysis_output), self.analysis_blocks(analysis_output), ANALYSIS_FOOTER)
+
+    # --- Fact-checks ---
+    def factcheck_blocks(self, factcheck_results):
+        if not factcheck_results:
+            return [NO_FACTCHECK_CLAIMS]
+        blocks = []
+        for entry, result in factcheck_results:
+            cache_note = ""
+            if 'cache_age_seconds' in result:
+                cache_note = FACTCHECK_CACHE_NOTE.substitute(age=formatAge(result['cache_age_seconds']))
+            parts = [FACTCHECK_CLAIM.substitute(username=entry.get('username', 'N/A'), claim=entry['claim'])]
+            for check in result.get('fact_check_results', []):
+                parts.append(FACTCHECK_VERDICT.substitute(
+                    verdict=humanize(check['verdict']),
+                    cache_note=cache_note,
+                    explanation=check['explanation']['claim_verdict_explanation'],
+                ))
+                for evaluation in check['explanation'].get('argument_evaluations', []):
+                    parts.append(FACTCHECK_ARGUMENT.substitute(
+                        argument_text=evaluation['argument_text'],
+                        argument_verdict=humanize(evaluation['argument_verdict']),
+                        argument_explanation=evaluation['argument_explanation'],
+                    ))
+                if check.get('sources'):
+                    sources = " ".join(FACTCHECK_SOURCE.substitute(number=number, url=source['url'], title=source['title'])
+                                       for number, source in enumerate(check['sources'], start=1))
+                    parts.append(f"\nSources: {sources}\n")
+                parts.append("\n")
+            blocks.append("".join(parts))
+        return blocks
+
+    def render_factcheck(self, author, factcheck_results):
+        return self.paginate(FACTCHECK_HEADER.substitute(author=author), self.factcheck_blocks(factcheck_results), FACTCHECK_FOOTER)
+
+    def render_full_analysis(self, author, analysis_output, factcheck_results):
+        """Fallacy breakdown followed by the fact-checks, paginated as one reply series."""
+        fact_blocks = self.factcheck_blocks(factcheck_results)
+        fact_blocks[0] = FACTCHECK_SECTION_HEADER + fact_blocks[0]
+        return self.paginate(self.analysis_header(author, analysis_output), self.analysis_blocks(analysis_output) + fact_blocks, FULL_ANALYSIS_FOOTER)
+
+    # --- Stats ---
+    def render_stats(self, author, target, type_counts, recent_entries):
+        """
+        Renders a !stats reply in a single comment. recent_entries maps each argument_type
+        to its most recent analyses, newest first; link lists are filled in that order until
+        the length budget runs out, and the rest are counted as not shown.
+        """
+        valid_count = type_counts.get('valid_argument', 0)
+        fallacy_count = type_counts.get('fallacy', 0)
+        no_argument_count = type_counts.get('no_argument_found', 0)
+        if not any(type_counts.values()):
+            return [NO_STATS.substitute(author=author, target=target)]
+
+        header = STATS_HEADER.substitute(
+            target=target,
+            author=author,
+            generated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC"),
+            total=valid_count + fallacy_count + no_argument_count,
+            valid=valid_count,
+            fallacies=fallacy_count,
+            no_arguments=no_argument_count,
+            score=valid_count - fallacy_count,  # +1 for valid, -1 for fallacy
+        )
+
+        remaining_budget = self.limit - len(header) - len(STATS_FOOTER)
+        parts = [header]
+        for index, (argument_type, title, empty_text) in enumerate(STATS_CATEGORIES):
+            count = type_counts.get(argument_type, 0)
+            # Keep room for the title, the omission note and the sections still to come
+            reserved = STATS_SECTION_RESERVE * (len(STATS_CATEGORIES) - index)
+            if not count:
+                section = f"{empty_text}\n\n"
+                parts.append(section)
+                remaining_budget -= len(section)
+                continue
+
+            section_parts = [f"**{title}:**\n"]
+            section_length = len(section_parts[0])
+            shown = 0
+            for entry in recent_entries.get(argument_type, []):
+                link_item = STATS_LINK.substitute(
+                    community=entry['redditCommunity'],
+                    thread_id=entry['redditThreadID'],
+                    comment_id=entry['redditCommentID'],
+                    overall=humanize(entry['context_overall_argument_type']),
+                    fallacy=f" - {entry['fallacy_type']}" if argument_type == 'fallacy' and entry['fallacy_type'] else "",
+                )
+                if section_length + len(link_item) > remaining_budget - reserved:
+                    break
+                section_parts.append(link_item)
+                section_length += len(link_item)
+                shown += 1
+
+            if count > shown:
+                section_parts.append(STATS_MORE.substitute(count=count - shown))
+            section_parts.append("\n")  # Blank line for spacing
+            section = "".join(section_parts)
+            parts.append(section)
+            remaining_budget -= len(section)
+
+        parts.append(STATS_FOOTER)
+        return ["".join(parts)]
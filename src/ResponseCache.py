@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from Metrics import metrics
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache for Gemini responses.
+
+    All calls in GenAI run at temperature 0.0, so identical inputs can be answered
+    from a previous response. Entries are keyed on a hash of the model, the prompt
+    file name and text, the response schema and the thread text, and stored in the
+    ResponseCache table of the bot's database. Entries older than max_age seconds
+    are ignored and evicted, and only the max_entries most recently used are kept.
+
+    Every entry also records a fingerprint of the files in prompts/ and schemas/.
+    When those files change, all entries written under the old fingerprint are dropped.
+    """
+
+    def __init__(self, db, max_entries=2000, max_age=7 * 24 * 3600, watch_dirs=("prompts", "schemas"), check_interval=30):
+        self.DB = db
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.watch_dirs = watch_dirs
+        self.check_interval = check_interval
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self._file_stamps = self._stat_watched_files()
+        self.fingerprint = self.compute_fingerprint()
+        self.DB.invalidate_cached_responses(self.fingerprint)
+
+    def _watched_files(self):
+        for directory in self.watch_dirs:
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    yield path
+
+    def _stat_watched_files(self):
+        stamps = {}
+        for path in self._watched_files():
+            stat = os.stat(path)
+            stamps[path] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def compute_fingerprint(self):
+        """Hashes the names and contents of every file in the watched directories."""
+        digest = hashlib.sha256()
+        for path in self._watched_files():
+            digest.update(path.encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def check_for_changes(self, force=False):
+        """Invalidates the cache if a prompt or schema file changed since the last check."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            stamps = self._stat_watched_files()
+            if stamps == self._file_stamps:
+                return
+            self._file_stamps = stamps
+            fingerprint = self.compute_fingerprint()
+            if fingerprint == self.fingerprint:
+                return
+            self.fingerprint = fingerprint
+
+        print("Prompt or schema files changed, invalidating the response cache.")
+        self.DB.invalidate_cached_responses(fingerprint)
+
+    def make_key(self, model, prompt_name, prompt, schema, contents):
+        payload = json.dumps({
+            "model": model,
+            "prompt_name": prompt_name,
+            "prompt": hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+            "schema": schema,
+            "contents": contents,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        self.check_for_changes()
+        response = self.DB.get_cached_response(key, time.time() - self.max_age)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.increment("cache.response.misses" if response is None else "cache.response.hits")
+        return response
+
+    def put(self, key, response):
+        self.DB.store_cached_response(key, self.fingerprint, response, self.max_entries, time.time() - self.max_age)
+
+    def invalidate(self):
+        """Drops every cached response."""
+        self.DB.invalidate_cached_responses()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
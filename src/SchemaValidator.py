@@ -0,0 +1,134 @@
+import json
+from collections import namedtuple
+
+from JSONStream import JSONArrayStreamParser
+
+# document: the usable part of the response; cut_off: array keys whose array was truncated;
+# dropped: array key -> entries that failed validation; complete: nothing was lost
+Salvage = namedtuple("Salvage", ["document", "complete", "cut_off", "dropped"])
+
+JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+}
+
+
+class SchemaValidator:
+    """
+    Checks model responses against one of the JSON schemas in schemas/.
+
+    The schema is compiled once into nested check functions covering the subset of
+    JSON Schema the response schemas use (type, enum, properties, required, items).
+    Optional properties may be missing or null; missing ones are filled in with None,
+    so code reading an entry never fails on a field the model left out.
+
+    salvage() keeps whatever part of a response is usable instead of rejecting it
+    as a whole: entries that fail validation are dropped, and when the text is cut
+    off, every complete entry before the cut-off is recovered with a
+    JSONArrayStreamParser.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self._check = self._compile(schema)
+        self._properties = {name: self._compile(subschema) for name, subschema in schema.get("properties", {}).items()}
+        self._items = {
+            name: self._compile(subschema["items"])
+            for name, subschema in schema.get("properties", {}).items() if "items" in subschema
+        }
+
+    def _compile(self, schema):
+        """Returns a function(value, path) -> list of error messages for the schema."""
+        type_name = schema.get("type")
+        python_type = JSON_TYPES.get(type_name)
+        enum = set(schema["enum"]) if "enum" in schema else None
+        properties = {name: self._compile(subschema) for name, subschema in schema.get("properties", {}).items()}
+        required = schema.get("required", [])
+        items = self._compile(schema["items"]) if "items" in schema else None
+
+        def check(value, path):
+            # bool is a subclass of int, but true/false are not numbers in JSON
+            if python_type and (not isinstance(value, python_type) or (isinstance(value, bool) and type_name != "boolean")):
+                return [f"{path}: expected {type_name}, got {type(value).__name__}"]
+            if enum is not None and value not in enum:
+                return [f"{path}: {value!r} is not one of {sorted(enum)}"]
+            errors = []
+            if type_name == "object":
+                for name in required:
+                    if name not in value:
+                        errors.append(f"{path}: missing required property '{name}'")
+                for name, check_property in properties.items():
+                    if name in required:
+                        if name in value:
+                            errors.extend(check_property(value[name], f"{path}.{name}"))
+                    elif value.get(name) is None:
+                        value[name] = None  # Optional properties may be missing or null
+                    else:
+                        errors.extend(check_property(value[name], f"{path}.{name}"))
+            elif items is not None:
+                for index, item in enumerate(value):
+                    errors.extend(items(item, f"{path}[{index}]"))
+            return errors
+
+        return check
+
+    def validate(self, value):
+        """Returns the list of validation errors for value (empty if it is valid)."""
+        return self._check(value, "$")
+
+    def validate_entry(self, array_key, entry):
+        """Returns the validation errors for a single entry of the array property array_key."""
+        return self._items[array_key](entry, f"$.{array_key}[]")
+
+    def salvage(self, text, array_keys):
+        """
+        Returns a Salvage of the response text. The document always contains array_keys,
+        holding only the valid entries; other top-level properties are kept if valid.
+        """
+        try:
+            document = json.loads(text or "")
+        except json.JSONDecodeError:
+            document = None
+
+        if isinstance(document, dict) and not self.validate(document):
+            return Salvage(document, True, set(), {})
+
+        cut_off = set()
+        if isinstance(document, dict):
+            arrays = {key: document.get(key) if isinstance(document.get(key), list) else [] for key in array_keys}
+        else:
+            # Not parseable (usually cut off): recover the entries that were complete
+            document = {}
+            arrays = {}
+            for key in array_keys:
+                parser = JSONArrayStreamParser(key)
+                arrays[key] = parser.feed(text or "")
+                if not parser.finished:
+                    cut_off.add(key)
+
+        salvaged = {}
+        for name, value in document.items():
+            if name in array_keys or name not in self._properties:
+                continue
+            errors = self._properties[name](value, f"$.{name}")
+            if errors:
+                print(f"Dropping invalid '{name}' from model response: {errors[0]}")
+            else:
+                salvaged[name] = value
+
+        dropped = {}
+        for key in array_keys:
+            salvaged[key] = []
+            for index, entry in enumerate(arrays[key]):
+                errors = self._items[key](entry, f"$.{key}[{index}]")
+                if errors:
+                    print(f"Dropping invalid entry from '{key}': {errors[0]}")
+                    dropped.setdefault(key, []).append(entry)
+                else:
+                    salvaged[key].append(entry)
+
+        return Salvage(salvaged, False, cut_off, dropped)
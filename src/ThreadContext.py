@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+import praw
+
+from Metrics import metrics
+
+
+class ThreadContextFetcher:
+    """
+    Resolves the ancestor chain of a comment from an in-memory copy of its
+    submission's comment forest instead of calling parent() once per level.
+
+    The forest is loaded with a single request and kept in a small TTL cache,
+    so repeated mentions in the same thread walk the chain without touching
+    the Reddit API at all. Ancestors that are not part of the loaded forest
+    (new comments, threads over comment_limit, or parents hidden behind "load
+    more comments") are fetched as a permalink with context, which returns the
+    missing comment and up to CONTEXT_DEPTH of its ancestors in one request, and
+    added to the cached forest for the next walk.
+    """
+
+    CONTEXT_DEPTH = 8  # Most ancestors Reddit returns with a comment permalink
+
+    def __init__(self, reddit, ttl=300, max_submissions=64, comment_limit=500):
+        self.API = reddit
+        self.ttl = ttl
+        self.max_submissions = max_submissions
+        self.comment_limit = comment_limit
+        self._cache = OrderedDict()  # submission ID -> (loaded_at, submission, {comment ID: comment})
+        self._lock = threading.Lock()
+
+    def _load(self, submission_id):
+        with metrics.timer("reddit.comment_forest_load"):
+            submission = self.API.submission(id=submission_id)
+            submission.comment_limit = self.comment_limit
+            comments_by_id = {
+                comment.id: comment
+                for comment in submission.comments.list()
+                if not isinstance(comment, praw.models.MoreComments)
+            }
+        entry = (time.monotonic(), submission, comments_by_id)
+
+        with self._lock:
+            self._cache[submission_id] = entry
+            self._cache.move_to_end(submission_id)
+            while len(self._cache) > self.max_submissions:
+                self._cache.popitem(last=False)
+        return entry
+
+    def _get(self, submission_id):
+        """Returns the cached forest for a submission, loading it if missing or expired."""
+        with self._lock:
+            entry = self._cache.get(submission_id)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._cache.move_to_end(submission_id)
+                metrics.increment("cache.thread_context.hits")
+                return entry
+        metrics.increment("cache.thread_context.misses")
+        return self._load(submission_id)
+
+    def _fetch_context(self, submission_id, comment_id):
+        """Returns the comment and the ancestors Reddit sends along with it, keyed by comment ID."""
+        with metrics.timer("reddit.context_fetch"):
+            listings = self.API.get(f"/comments/{submission_id}/_/{comment_id}", params={"context": self.CONTEXT_DEPTH})
+        comments_by_id = {}
+        pending = list(listings[1].children)
+        while pending:
+            comment = pending.pop()
+            if isinstance(comment, praw.models.MoreComments):
+                continue
+            comments_by_id[comment.id] = comment
+            pending.extend(comment.replies)
+        return comments_by_id
+
+    def get_ancestors(self, start_comment):
+        """
+        Returns the ancestor comments of start_comment (oldest first) and its submission.
+        """
+        submission_id = start_comment.submission.id
+        _, submission, comments_by_id = self._get(submission_id)
+
+        path = []
+        parent_id = start_comment.parent_id
+        while parent_id.startswith("t1_"):
+            parent = comments_by_id.get(parent_id[3:])
+            if parent is None:
+                # One request resolves the missing parent and the next CONTEXT_DEPTH levels above it
+                for comment_id, comment in self._fetch_context(submission_id, parent_id[3:]).items():
+                    comments_by_id.setdefault(comment_id, comment)
+                parent = comments_by_id.get(parent_id[3:])
+                if parent is None:
+                    print(f"Could not resolve parent {parent_id} in submission {submission_id}.")
+                    break
+
+            path.insert(0, parent)
+            parent_id = parent.parent_id
+        else:
+            if not parent_id.startswith("t3_"):
+                print("Unexpected parent type or end of tree without reaching submission.")
+
+        return path, submission
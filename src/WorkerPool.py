@@ -0,0 +1,55 @@
+import queue
+import threading
+import zlib
+
+
+class WorkerPool:
+    """
+    A fixed pool of worker threads fed through bounded per-worker queues.
+
+    Items are routed to a worker by hashing their ordering key, so every item
+    sharing a key (e.g. all mentions in the same Reddit thread) is handled by
+    the same worker in the order it was submitted. Because each queue is
+    bounded, submit() blocks once a worker falls behind, which pushes the
+    backpressure back onto the producer (the inbox stream).
+    """
+
+    def __init__(self, handler, num_workers=4, queue_size=32, name="worker"):
+        self.handler = handler
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(max(1, num_workers))]
+        self.threads = []
+        for index, work_queue in enumerate(self.queues):
+            t = threading.Thread(target=self._work, args=(work_queue,), name=f"{name}-{index}", daemon=True)
+            self.threads.append(t)
+            t.start()
+
+    def _work(self, work_queue):
+        while True:
+            item = work_queue.get()
+            try:
+                if item is None:
+                    return
+                self.handler(item)
+            except Exception as e:
+                print(f"An unexpected error occurred in {threading.current_thread().name}: {e}")
+            finally:
+                work_queue.task_done()
+
+    def submit(self, item, key=None):
+        """Queues an item, blocking while the target worker's queue is full."""
+        if key is None:
+            work_queue = min(self.queues, key=lambda q: q.qsize())
+        else:
+            work_queue = self.queues[zlib.crc32(str(key).encode('utf-8')) % len(self.queues)]
+        work_queue.put(item)
+
+    def queue_depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def shutdown(self, wait=True):
+        """Lets the workers drain their queues, then stops them."""
+        for work_queue in self.queues:
+            work_queue.put(None)
+        if wait:
+            for t in self.threads:
+                t.join()